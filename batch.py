@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import os
+from dotenv import load_dotenv
+
+from function_chatbot import quick_answer, handle_medical_question
+from inference import llm_lane, InferenceOverloaded, InferenceTimeout
+from singleflight import single_flight, flight_key
+from metrics import stage, ERRORS
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Gemini calls one batch keeps in flight by default, and the most a caller may ask for.
+# Every call still goes through the LLM lane, so GEMINI_MAX_CONCURRENCY caps them all.
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 4))
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", 16))
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 200))
+
+
+def _item_error(e):
+    """Per-item error text, so one failed question does not fail the whole batch"""
+    if isinstance(e, InferenceOverloaded):
+        ERRORS.inc(endpoint="batch", kind="overloaded")
+        return "Too many requests in progress, please retry shortly"
+    if isinstance(e, InferenceTimeout):
+        ERRORS.inc(endpoint="batch", kind="timeout")
+        return "The assistant took too long to respond"
+    ERRORS.inc(endpoint="batch", kind=type(e).__name__)
+    logger.error(f"Error answering batch question: {e}")
+    return "Internal server error while processing query"
+
+
+async def answer_batch(items, concurrency=None):
+    """
+    Answer (question, previous_chats) items, yielding (index, result) pairs as they finish.
+
+    Fixed, knowledge base and cached answers are routed locally first and come out straight
+    away. The remaining questions go to Gemini at most `concurrency` at a time, through the
+    LLM lane and single-flight like /query/; identical questions with the same context are
+    asked once. A result is {"answer": ...} or {"error": ...}.
+    """
+    concurrency = max(1, min(concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+
+    local, groups = [], {}
+    with stage("batch_routing"):
+        for index, (question, previous_chats) in enumerate(items):
+            response = quick_answer(question, previous_chats)
+            if response is not None:
+                local.append((index, {"answer": response.get("answer", "No response generated")}))
+            else:
+                key = flight_key("query", question, previous_chats)
+                # Questions with no key (only filler words) cannot be told apart, so each is asked alone
+                groups.setdefault(key if key is not None else ("item", index), []).append(index)
+    for pair in local:
+        yield pair
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def ask(key, indexes):
+        question, previous_chats = items[indexes[0]]
+        async with semaphore:
+            try:
+                flight = None if key[0] == "item" else key
+                response = await single_flight.run(
+                    flight, lambda: llm_lane.run(handle_medical_question, question, previous_chats)
+                )
+                return indexes, {"answer": response.get("answer", "No response generated")}
+            except Exception as e:
+                return indexes, {"error": _item_error(e)}
+
+    tasks = [asyncio.ensure_future(ask(key, indexes)) for key, indexes in groups.items()]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            indexes, result = await finished
+            for index in indexes:
+                yield index, result
+    finally:
+        # The client went away or the caller stopped early: drop questions not started yet
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,76 @@
+"""
+/query/batch throughput against one /query/ call per question, with Gemini stubbed.
+
+Each Gemini call sleeps for --gemini-latency, so a serial client pays that
+once per question. The batch endpoint answers fixed intents locally and
+keeps up to `concurrency` Gemini calls in flight, so its time should fall
+roughly in proportion to the limit until the LLM lane
+(GEMINI_MAX_CONCURRENCY) is saturated. Every run uses fresh questions so
+the response cache never answers them. Run from the repository root:
+
+    python -m benchmarks.batch_queries --questions 64 --levels 1 4 8 16
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.stubs import install_stubs
+
+FIXED_QUESTIONS = ["what is your contact number", "what services do you offer", "how do I book a lab test"]
+
+
+def questions(count, run):
+    """Mostly Gemini-bound questions, unique per run, with a fixed-intent question every eighth item"""
+    return [FIXED_QUESTIONS[i % len(FIXED_QUESTIONS)] if i % 8 == 7
+            else f"what does a high ESR value mean for patient {run}-{i}" for i in range(count)]
+
+
+async def serial(client, items):
+    for question in items:
+        response = await client.get("/query/", params={"user_input": question})
+        response.raise_for_status()
+
+
+async def batch(client, items, concurrency, stream):
+    params = {"concurrency": concurrency, "stream": stream, "record": False}
+    response = await client.post("/query/batch", params=params, json={"items": items})
+    response.raise_for_status()
+    lines = response.text.splitlines() if stream else response.json()["results"]
+    assert len(lines) == len(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=64)
+    parser.add_argument("--gemini-latency", type=float, default=0.2, help="seconds per stubbed Gemini call")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--stream", action="store_true", help="request NDJSON instead of one JSON body")
+    args = parser.parse_args()
+
+    # Let the lane and the batch limit go as high as the largest level asked for
+    os.environ.setdefault("GEMINI_MAX_CONCURRENCY", str(max(args.levels)))
+    os.environ.setdefault("BATCH_MAX_CONCURRENCY", str(max(args.levels)))
+    install_stubs(gemini_latency=args.gemini_latency)
+    import httpx
+    from vector import app
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            print(f"{'mode':>12} {'seconds':>8} {'questions/s':>12}")
+            started = time.perf_counter()
+            await serial(client, questions(args.questions, "serial"))
+            elapsed = time.perf_counter() - started
+            print(f"{'serial':>12} {elapsed:>8.2f} {args.questions / elapsed:>12.1f}")
+            for concurrency in args.levels:
+                started = time.perf_counter()
+                await batch(client, questions(args.questions, concurrency), concurrency, args.stream)
+                elapsed = time.perf_counter() - started
+                print(f"{f'batch x{concurrency}':>12} {elapsed:>8.2f} {args.questions / elapsed:>12.1f}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+chat_history storage benchmark: table size, write and read latency, session
+clear and expiry cost, per table layout, against a real MySQL server.
+
+For each layout the benchmark drops and recreates a scratch database, loads
+--rows chat turns spread evenly over the last --days days, and reports:
+
+    load       bulk insert throughput while filling the table (rows/s)
+    size       data + index size after ANALYZE TABLE
+    insert     one insert_chat, and one insert_chats of 100 rows (p50 ms)
+    read       get_recent_chats for a random session (p50 ms)
+    clear      clear_chat_history of the "default" session, which holds 1% of all rows
+    expire     removing the oldest --expire-days days: partition drops on a
+               partitioned table, batched deletes on a plain one
+
+Layouts: plain (unpartitioned, uncompressed), partitioned, partitioned-zlib,
+partitioned-zstd. The default of 10M rows needs tens of GB of disk and can
+take hours; use --rows to try smaller sizes first. Connection settings come
+from the usual DATABASE_* variables. Run from the repository root:
+
+    python -m benchmarks.chat_retention --rows 1000000 --layouts plain partitioned-zlib
+"""
+import argparse
+import calendar
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+import mysql.connector
+
+from database import DatabaseManager, DATABASE_NAME
+from function_chatbot import STATIC_ANSWERS
+
+LAYOUTS = {
+    "plain": (False, ""),
+    "partitioned": (True, ""),
+    "partitioned-zlib": (True, "zlib"),
+    "partitioned-zstd": (True, "zstd"),
+}
+
+
+def make_responses(count=500, seed=3):
+    """HTML answers shaped like the real ones: fixed answers cut at random points plus a varying tail"""
+    rng = random.Random(seed)
+    answers = list(STATIC_ANSWERS.values())
+    responses = []
+    for i in range(count):
+        answer = rng.choice(answers)
+        responses.append(answer[:rng.randint(len(answer) // 3, len(answer))] + f"<p>Reference {i}-{rng.random():.6f}</p>")
+    return responses
+
+
+def load(db, rows, days, sessions, batch, seed=5):
+    """Insert `rows` turns spread over the last `days` days, oldest first; returns rows per second"""
+    rng = random.Random(seed)
+    responses = make_responses()
+    end = datetime.now()
+    step = timedelta(days=days) / rows
+    started = time.perf_counter()
+    for offset in range(0, rows, batch):
+        chunk = []
+        for i in range(offset, min(rows, offset + batch)):
+            # 1% of turns come from clients that never sent a session id
+            session_id = "default" if rng.random() < 0.01 else f"s{rng.randrange(sessions)}"
+            chunk.append((session_id, f"question {i}", rng.choice(responses), end - timedelta(days=days) + step * i))
+        if not db.insert_chats(chunk):
+            raise RuntimeError("insert_chats failed while loading")
+        if offset and offset % (batch * 200) == 0:
+            print(f"    loaded {offset} rows")
+    return rows / (time.perf_counter() - started)
+
+
+def table_mb(db):
+    with db.get_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("ANALYZE TABLE chat_history")
+        cursor.fetchall()
+        cursor.execute("""
+            SELECT DATA_LENGTH + INDEX_LENGTH FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'chat_history'
+        """, (db.database,))
+        size = cursor.fetchone()[0]
+        cursor.close()
+    return size / 2**20
+
+
+def p50_ms(fn, trials):
+    timings = []
+    for _ in range(trials):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def run_layout(name, args):
+    partitioned, compression = LAYOUTS[name]
+    db = DatabaseManager(pool_size=2, database=args.database, partitioned=partitioned, compression=compression)
+    bootstrap = mysql.connector.connect(**db._connection_config())
+    cursor = bootstrap.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS {args.database}")
+    cursor.close()
+    bootstrap.close()
+    today = datetime.now(timezone.utc).date()
+    db.migrate(first_day=today - timedelta(days=args.days))
+
+    print(f"  {name}: loading {args.rows} rows")
+    rows_per_second = load(db, args.rows, args.days, args.sessions, args.batch)
+    size = table_mb(db)
+
+    rng = random.Random(11)
+    response = make_responses(1)[0]
+    single = p50_ms(lambda: db.insert_chat("question", response, f"s{rng.randrange(args.sessions)}"), args.trials)
+    many_rows = [(f"s{rng.randrange(args.sessions)}", "question", response, datetime.now()) for _ in range(100)]
+    many = p50_ms(lambda: db.insert_chats(many_rows), max(1, args.trials // 10))
+    read = p50_ms(lambda: db.get_recent_chats(f"s{rng.randrange(args.sessions)}", 6), args.trials)
+
+    started = time.perf_counter()
+    cleared = db.clear_chat_history("default")
+    clear_seconds = time.perf_counter() - started
+
+    cutoff_day = today - timedelta(days=args.days - args.expire_days)
+    cutoff = calendar.timegm(cutoff_day.timetuple())
+    started = time.perf_counter()
+    expired = db.drop_partitions_before(cutoff)[1] if partitioned else 0
+    expired += db.delete_chats_before(cutoff, args.delete_batch)
+    expire_seconds = time.perf_counter() - started
+    db.close_connection()
+
+    return {
+        "layout": name, "load_rps": rows_per_second, "size_mb": size, "insert_ms": single, "insert_100_ms": many,
+        "read_ms": read, "cleared": cleared, "clear_s": clear_seconds, "expired": expired, "expire_s": expire_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--days", type=int, default=30, help="days of history the rows are spread over")
+    parser.add_argument("--expire-days", type=int, default=7, help="oldest days to expire")
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--batch", type=int, default=5000, help="rows per insert while loading")
+    parser.add_argument("--delete-batch", type=int, default=5000, help="rows per DELETE when expiring")
+    parser.add_argument("--trials", type=int, default=200)
+    parser.add_argument("--layouts", nargs="+", choices=list(LAYOUTS), default=list(LAYOUTS))
+    parser.add_argument("--database", default=f"{DATABASE_NAME}_bench", help="scratch database, dropped and recreated")
+    args = parser.parse_args()
+
+    results = [run_layout(name, args) for name in args.layouts]
+
+    print(f"{'layout':>17} {'load rps':>9} {'size MB':>9} {'insert ms':>10} {'x100 ms':>8} {'read ms':>8} "
+          f"{'cleared':>8} {'clear s':>8} {'expired':>9} {'expire s':>9}")
+    for r in results:
+        print(f"{r['layout']:>17} {r['load_rps']:>9.0f} {r['size_mb']:>9.0f} {r['insert_ms']:>10.2f} "
+              f"{r['insert_100_ms']:>8.2f} {r['read_ms']:>8.2f} {r['cleared']:>8} {r['clear_s']:>8.2f} "
+              f"{r['expired']:>9} {r['expire_s']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
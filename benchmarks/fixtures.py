@@ -0,0 +1,102 @@
+"""Small but valid DOCX, PDF and PNG documents built in memory for upload benchmarks"""
+import io
+import struct
+import zipfile
+import zlib
+
+REPORT_LINES = [
+    "Patient: Test Patient, Age 45",
+    "Haemoglobin: 11.2 g/dL (13.0 - 17.0)",
+    "Fasting blood sugar: 128 mg/dL (70 - 100)",
+    "TSH: 5.8 uIU/mL (0.4 - 4.0)",
+    "Impression: mild anaemia, impaired fasting glucose, subclinical hypothyroidism",
+]
+
+
+def make_docx(lines=REPORT_LINES, marker=""):
+    paragraphs = "".join(
+        f'<w:p><w:r><w:t xml:space="preserve">{line} {marker}</w:t></w:r></w:p>' for line in lines
+    )
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{paragraphs}</w:body></w:document>"
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        "</Types>"
+    )
+    rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="word/document.xml"/></Relationships>'
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", content_types)
+        archive.writestr("_rels/.rels", rels)
+        archive.writestr("word/document.xml", document)
+    return buffer.getvalue()
+
+
+def make_pdf(lines=REPORT_LINES, pages=1, marker=""):
+    """A PDF with a real text layer, one copy of the report per page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for _ in range(pages):
+        text = " ".join(f"({line} {marker}) Tj 0 -16 Td" for line in lines)
+        stream = f"BT /F1 11 Tf 50 780 Td {text} ET".encode()
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream.decode()}\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(output.tell())
+        output.write(f"{number} 0 obj\n{body}\nendobj\n".encode())
+    xref = output.tell()
+    output.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        output.write(f"{offset:010d} 00000 n \n".encode())
+    output.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return output.getvalue()
+
+
+def make_png(width=1600, height=1200, seed=0):
+    """An RGB PNG with a noisy gradient, roughly the size of a phone photo of a report"""
+    rows = []
+    for y in range(height):
+        row = bytearray([0])
+        for x in range(width):
+            value = (x * 7 + y * 3 + seed + (x * y) % 13) & 0xFF
+            row += bytes((value, (value + 85) & 0xFF, (value + 170) & 0xFF))
+        rows.append(bytes(row))
+    raw = zlib.compress(b"".join(rows), 6)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", raw) + chunk(b"IEND", b"")
+
+
+def tag_png(png, marker):
+    """Copy of a PNG with a tEXt chunk, so each upload has a distinct content hash"""
+    data = b"Comment\x00" + marker.encode()
+    text_chunk = struct.pack(">I", len(data)) + b"tEXt" + data + struct.pack(">I", zlib.crc32(b"tEXt" + data) & 0xFFFFFFFF)
+    # IEND is always the final 12 bytes
+    return png[:-12] + text_chunk + png[-12:]
@@ -0,0 +1,119 @@
+"""
+Formatter micro-benchmark: the single-pass format_response_to_html against the
+original multi-pass version, on long LLM-style markdown answers.
+
+Also reports how many outputs from each version have unbalanced <ul>/<ol>
+tags, and the cost of serving a fixed answer from the pre-rendered
+STATIC_ANSWERS table versus formatting it per request. Run from the
+repository root:
+
+    python -m benchmarks.formatter
+"""
+import argparse
+import re
+import time
+
+from function_chatbot import format_response_to_html, MARKDOWN_ANSWERS, STATIC_ANSWERS
+
+SECTION = """**{title}**
+Here is what you should know about this, based on the details you shared.
+
+1. **Rest** - give your body time to recover
+2. Drink plenty of fluids, at least 2.5 litres a day
+3. Take 1.5 mg only if your doctor has prescribed it
+- Avoid spicy food for a few days
+- Track your temperature twice a day
+• Book a follow-up if symptoms persist
+Follow-up questions you could ask your doctor:
+1. Is this dose safe alongside my other medicines?
+2. When should I repeat the test?
+"""
+
+
+def legacy_format(text):
+    """The original format_response_to_html, kept verbatim for comparison"""
+    text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', text)
+
+    lines = text.split('\n')
+    formatted_lines = []
+    in_list = False
+
+    for line in lines:
+        line = line.strip()
+        if line.startswith('•') or line.startswith('-'):
+            if not in_list:
+                formatted_lines.append('<ul>')
+                in_list = True
+            item = line.lstrip('•-').strip()
+            formatted_lines.append(f'<li>{item}</li>')
+        elif line.startswith(('1.', '2.', '3.', '4.', '5.', '6.', '7.', '8.', '9.')):
+            if in_list and formatted_lines[-1] != '</ul>':
+                formatted_lines.append('</ul>')
+                in_list = False
+            if not in_list or formatted_lines[-1] == '</ul>':
+                formatted_lines.append('<ol>')
+                in_list = True
+            item = re.sub(r'^\d+\.\s*', '', line)
+            formatted_lines.append(f'<li>{item}</li>')
+        else:
+            if in_list:
+                formatted_lines.append('</ul>' if formatted_lines[-1].startswith('<li>') else '</ol>')
+                in_list = False
+            if line:
+                formatted_lines.append(f'<p>{line}</p>')
+
+    if in_list:
+        formatted_lines.append('</ul>' if '•' in text or '-' in text else '</ol>')
+
+    return '\n'.join(formatted_lines)
+
+
+def make_answer(sections):
+    return "\n".join(SECTION.format(title=f"Section {n + 1}") for n in range(sections))
+
+
+def balanced(html):
+    """True when every <ul>/<ol> is closed by the matching tag"""
+    open_tags = []
+    for closing, tag in re.findall(r'<(/?)(ul|ol)>', html):
+        if not closing:
+            open_tags.append(tag)
+        elif not open_tags or open_tags.pop() != tag:
+            return False
+    return not open_tags
+
+
+def measure(formatter, texts, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            formatter(text)
+    return (time.perf_counter() - started) / (rounds * len(texts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--sections", type=int, nargs="+", default=[1, 10, 50])
+    args = parser.parse_args()
+
+    print(f"{'formatter':>10} {'sections':>9} {'bytes':>8} {'us/answer':>10} {'balanced':>9}")
+    for sections in args.sections:
+        text = make_answer(sections)
+        for name, formatter in [("legacy", legacy_format), ("single", format_response_to_html)]:
+            per_answer = measure(formatter, [text], args.rounds)
+            ok = "yes" if balanced(formatter(text)) else "no"
+            print(f"{name:>10} {sections:>9} {len(text):>8} {per_answer * 1e6:>10.1f} {ok:>9}")
+
+    texts = list(MARKDOWN_ANSWERS.values())
+    per_format = measure(format_response_to_html, texts, args.rounds * 10)
+    started = time.perf_counter()
+    for _ in range(args.rounds * 10):
+        for intent in MARKDOWN_ANSWERS:
+            STATIC_ANSWERS[intent]
+    per_lookup = (time.perf_counter() - started) / (args.rounds * 10 * len(texts))
+    print(f"\nfixed answer: format per request {per_format * 1e6:.2f} us, pre-rendered lookup {per_lookup * 1e6:.3f} us")
+
+
+if __name__ == "__main__":
+    main()
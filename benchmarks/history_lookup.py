@@ -0,0 +1,84 @@
+"""
+History lookup latency as chat_history grows, on SQLite as a MySQL stand-in.
+
+The table is filled in steps up to --max-rows, spread over --sessions
+conversations. After each step the benchmark times two queries. The
+per-session query uses the (session_id, created_at) index, so it is an
+O(log n) index seek. The old global query ran ORDER BY created_at over the
+whole table with no index. Per-session latency should stay flat while the
+global query grows with the table. Run from the repository root:
+
+    python -m benchmarks.history_lookup --max-rows 2000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+SESSION_QUERY = """
+    SELECT question, response FROM chat_history
+    WHERE session_id = ? ORDER BY created_at DESC, id DESC LIMIT 2
+"""
+GLOBAL_QUERY = "SELECT question, response FROM chat_history ORDER BY created_at DESC LIMIT 2"
+
+
+def fill(connection, start, stop, sessions):
+    rows = (
+        (f"session-{i % sessions}", f"question {i}", "<p>answer</p>", f"2025-01-01 00:00:00.{i:09d}")
+        for i in range(start, stop)
+    )
+    connection.executemany(
+        "INSERT INTO chat_history (session_id, question, response, created_at) VALUES (?, ?, ?, ?)", rows
+    )
+    connection.commit()
+
+
+def time_query(connection, query, params_fn, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        connection.execute(query, params_fn()).fetchall()
+    return (time.perf_counter() - started) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-rows", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=50_000)
+    parser.add_argument("--repeats", type=int, default=2000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="nidhaan-history-"), "history.db")
+    connection = sqlite3.connect(path)
+    connection.execute("""
+        CREATE TABLE chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            question TEXT NOT NULL,
+            response TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    """)
+    connection.execute("CREATE INDEX idx_session_created ON chat_history (session_id, created_at)")
+
+    steps, size = [], 10_000
+    while size < args.max_rows:
+        steps.append(size)
+        size *= 10
+    steps.append(args.max_rows)
+
+    print(f"{'rows':>10} {'per-session us':>15} {'global scan us':>15}")
+    filled = 0
+    for rows in steps:
+        fill(connection, filled, rows, args.sessions)
+        filled = rows
+        session_us = time_query(
+            connection, SESSION_QUERY, lambda: (f"session-{random.randrange(args.sessions)}",), args.repeats
+        ) * 1e6
+        global_us = time_query(connection, GLOBAL_QUERY, lambda: (), max(1, args.repeats // 100)) * 1e6
+        print(f"{rows:>10} {session_us:>15.1f} {global_us:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Intent routing micro-benchmark: the compiled matcher in intents.py against the
+original any(phrase in question) ladder.
+
+Each corpus entry is labelled with the intent a person would expect, or None
+when the question should go to Gemini. Run from the repository root:
+
+    python -m benchmarks.intent_routing
+"""
+import argparse
+import time
+
+from intents import match_intent
+
+CORPUS = [
+    ("What is your contact number?", "contact"),
+    ("How can I reach customer support", "contact"),
+    ("send me your email address", "contact"),
+    ("how to order medicine online", "order_medicine"),
+    ("I want to buy medicine for my mother", "order_medicine"),
+    ("is medicine delivery available in my area", "order_medicine"),
+    ("book appointment with a cardiologist", "appointment"),
+    ("can I schedule a video call with a doctor", "appointment"),
+    ("I need two appointments for tomorrow", "appointment"),
+    ("what plans do you offer", "plans"),
+    ("tell me about the family subscription", "plans"),
+    ("what is nidhaan", "about"),
+    ("which services do you provide", "about"),
+    ("tell me about nidhaan", "about"),
+    ("thank you so much", "thanks"),
+    ("thanks for the help", "thanks"),
+    ("I really appreciate it", "thanks"),
+    # Medical questions that should reach Gemini
+    ("can you give an explanation of my thyroid results", None),
+    ("this rash on my arm is itchy, what is it", None),
+    ("what is a normal blood sugar level", None),
+    ("I have had a headache and fever since this morning", None),
+    ("should I take paracetamol for a migraine", None),
+    ("my child has a cough that sounds like a seal barking", None),
+    ("is it safe to exercise with high blood pressure", None),
+    ("what does an elevated ALT mean", None),
+    ("explain the side effects of metformin", None),
+    ("my reaching arm hurts after lifting weights", None),
+    ("which vitamins help with hair fall", None),
+    ("I feel dizzy when I stand up quickly", None),
+    ("what are the symptoms of dengue", None),
+]
+
+
+def legacy_route(user_question):
+    """The original if/elif ladder from handle_fixed_questions, reduced to intent names"""
+    question = user_question.lower().strip()
+    if any(word in question for word in ['contact', 'phone', 'email', 'address', 'reach', 'support']):
+        return "contact"
+    elif any(phrase in question for phrase in
+             ['order medicine', 'buy medicine', 'purchase medicine', 'how to order', 'medicine delivery']):
+        return "order_medicine"
+    elif any(phrase in question for phrase in ['appointment', 'book appointment', 'schedule', 'booking']):
+        return "appointment"
+    elif any(phrase in question for phrase in ['plan', 'plans', 'healthcare plan', 'subscription', 'package']):
+        return "plans"
+    elif any(phrase in question for phrase in
+             ['about company', 'about nidhaan', 'company details', 'services', 'what is nidhaan']):
+        return "about"
+    elif any(phrase in question for phrase in ['thank you', 'thanks', 'appreciate', 'grateful']):
+        return "thanks"
+    return None
+
+
+def compiled_route(user_question):
+    return match_intent(user_question.lower().strip())
+
+
+def measure(router, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for question, _ in CORPUS:
+            router(question)
+    per_query = (time.perf_counter() - started) / (rounds * len(CORPUS))
+    correct = sum(router(question) == expected for question, expected in CORPUS)
+    return per_query, correct
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--show-misroutes", action="store_true")
+    args = parser.parse_args()
+
+    print(f"{'router':>9} {'us/query':>9} {'accuracy':>9}")
+    for name, router in [("legacy", legacy_route), ("compiled", compiled_route)]:
+        per_query, correct = measure(router, args.rounds)
+        print(f"{name:>9} {per_query * 1e6:>9.2f} {correct:>4}/{len(CORPUS)}")
+        if args.show_misroutes:
+            for question, expected in CORPUS:
+                routed = router(question)
+                if routed != expected:
+                    print(f"    {question!r}: expected {expected}, got {routed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Knowledge base index benchmark at sizes well beyond the shipped service docs.
+
+Synthetic sections are generated from the vocabulary of knowledge/*.md and
+indexed the way knowledge_base.py does it. For each size the benchmark
+reports:
+
+    build      feature hashing of every section plus int8 quantization
+    save/map   writing vectors.npy and memory-mapping it again
+    query      one search: embed the question and score every row (p50/p95)
+    memory     index size as int8 vs float32, and process peak RSS
+
+Run from the repository root:
+
+    python -m benchmarks.knowledge_index --sizes 10000 100000
+"""
+import argparse
+import os
+import random
+import resource
+import tempfile
+import time
+
+import numpy as np
+
+from knowledge_base import KNOWLEDGE_DIR, load_documents, build_index, embed, top_k, _WORD
+
+QUESTIONS = [
+    "do you collect blood samples at home", "how do I book a lab test", "do you have a family plan",
+    "which doctor specialties do you have", "cash on delivery for medicines", "counseling for anxiety",
+]
+
+
+def synthetic_sections(count, seed=7):
+    vocabulary = sorted({word for chunk in load_documents(KNOWLEDGE_DIR)
+                         for word in _WORD.findall(chunk["text"].lower())})
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(vocabulary, k=rng.randint(30, 90))) for _ in range(count)]
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dim", type=int, default=int(os.environ.get("KB_DIM", 1024)))
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"dim {args.dim}")
+    print(f"{'sections':>9} {'build s':>8} {'save ms':>8} {'map ms':>7} {'p50 ms':>7} {'p95 ms':>7} "
+          f"{'int8 MB':>8} {'f32 MB':>7} {'rss MB':>7}")
+    for size in args.sizes:
+        texts = synthetic_sections(size)
+
+        started = time.perf_counter()
+        vectors = build_index(texts, args.dim)
+        build = time.perf_counter() - started
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "vectors.npy")
+            started = time.perf_counter()
+            np.save(path, vectors)
+            save = time.perf_counter() - started
+            started = time.perf_counter()
+            mapped = np.load(path, mmap_mode="r")
+            load = time.perf_counter() - started
+
+            latencies = []
+            for i in range(args.queries):
+                started = time.perf_counter()
+                top_k(mapped, embed([QUESTIONS[i % len(QUESTIONS)]], args.dim)[0], 3)
+                latencies.append(time.perf_counter() - started)
+            latencies.sort()
+            del mapped
+
+        print(f"{size:>9} {build:>8.2f} {save * 1000:>8.1f} {load * 1000:>7.2f} "
+              f"{latencies[len(latencies) // 2] * 1000:>7.2f} {latencies[int(len(latencies) * 0.95)] * 1000:>7.2f} "
+              f"{vectors.nbytes / 2**20:>8.1f} {vectors.nbytes * 4 / 2**20:>7.1f} {peak_rss_mb():>7.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Load test for the LLM lane of the inference gate using a fake Gemini with injected latency.
+
+Questions that miss the fixed intents go to the stub model, which sleeps for
+--gemini-latency seconds. With the calls running on the gate's thread pool,
+throughput should grow with concurrency up to GEMINI_MAX_CONCURRENCY. Past
+max concurrency + GEMINI_MAX_QUEUE the API answers 429 instead of queueing.
+Run from the repository root:
+
+    GEMINI_MAX_CONCURRENCY=16 python -m benchmarks.llm_concurrency
+"""
+import argparse
+import asyncio
+from collections import Counter
+
+from benchmarks.stubs import install_stubs, drive
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="seconds per fake Gemini call")
+    parser.add_argument("--requests-per-level", type=int, default=64)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    install_stubs(gemini_latency=args.gemini_latency)
+    from vector import app
+    from inference import llm_lane
+
+    print(f"llm lane: {llm_lane.max_concurrency} workers, {llm_lane.max_queue} queued")
+    print(f"{'concurrency':>11} {'rps':>8} {'p50 s':>7} {'max s':>7}  statuses")
+    for concurrency in args.levels:
+        elapsed, latencies, statuses = asyncio.run(
+            drive(app, "GET", "/query/", concurrency, args.requests_per_level,
+                  params={"user_input": "I have a mild fever and headache since yesterday"})
+        )
+        latencies.sort()
+        print(f"{concurrency:>11} {args.requests_per_level / elapsed:>8.2f} "
+              f"{latencies[len(latencies) // 2]:>7.2f} {latencies[-1]:>7.2f}  {dict(Counter(statuses))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Load test for the whole API with a stub Gemini backend and SQLite in place of MySQL.
+
+The vector.py app is imported with fake `google.generativeai` and `database`
+modules (see benchmarks/stubs.py). It is then driven in-process over ASGI
+with a weighted mix of scenarios at each concurrency level:
+
+    fixed   /query/ questions answered by the intent table
+    llm     /query/ questions that go to the (stub) model
+    docx    /upload/ of a DOCX lab report with a question
+    pdf     /upload/ of a multi-page PDF report
+    image   /upload/ of a ~1 MB PNG photo
+
+Questions and documents carry a unique marker, so the response and
+document caches miss as they would for real traffic. The report is JSON
+with RPS, p50/p95/p99 latency per scenario, status codes and peak RSS. It
+records the git commit so runs can be compared:
+
+    python -m benchmarks.load_test --output before.json
+    python -m benchmarks.load_test --output after.json
+    python -m benchmarks.load_test --compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import resource
+import subprocess
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from benchmarks.fixtures import make_docx, make_pdf, make_png, tag_png
+from benchmarks.stubs import SQLiteDatabaseManager, install_stubs
+
+FIXED_QUESTIONS = [
+    "what is your contact number", "how to order medicine", "book appointment with a dermatologist",
+    "what plans do you have", "tell me about nidhaan", "thank you",
+]
+LLM_QUESTIONS = [
+    "I have a mild fever and headache since yesterday", "what is a normal blood sugar level",
+    "is it safe to take ibuprofen with high blood pressure", "my child has a dry cough at night",
+]
+DEFAULT_MIX = "fixed=0.35,llm=0.4,docx=0.1,pdf=0.1,image=0.05"
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return round(sorted_values[index] * 1000, 2)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+class Scenarios:
+    def __init__(self, pdf_pages):
+        self.base_png = make_png()
+        self.pdf_pages = pdf_pages
+
+    def request(self, name, session_id):
+        marker = uuid.uuid4().hex[:8]
+        params = {"session_id": session_id}
+        if name == "fixed":
+            params["user_input"] = random.choice(FIXED_QUESTIONS)
+            return "GET", "/query/", {"params": params}
+        if name == "llm":
+            params["user_input"] = f"{random.choice(LLM_QUESTIONS)} (case {marker})"
+            return "GET", "/query/", {"params": params}
+        if name == "docx":
+            params["user_query"] = "is my sugar level normal?"
+            content = ("report.docx", make_docx(marker=marker))
+        elif name == "pdf":
+            content = ("report.pdf", make_pdf(pages=self.pdf_pages, marker=marker))
+        else:
+            content = ("photo.png", tag_png(self.base_png, marker))
+        return "POST", "/upload/", {"params": params, "files": {"file": content}}
+
+
+async def run_level(app, scenarios, mix, concurrency, total):
+    import httpx
+
+    names, weights = zip(*mix.items())
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(random.choices(names, weights)[0])
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def user():
+            # Each virtual user keeps one conversation, like a browser tab
+            session_id = uuid.uuid4().hex
+            while not queue.empty():
+                name = queue.get_nowait()
+                method, path, kwargs = scenarios.request(name, session_id)
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **kwargs)
+                    statuses[name][response.status_code] += 1
+                except Exception as e:
+                    statuses[name][type(e).__name__] += 1
+                latencies[name].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    everything = sorted(value for values in latencies.values() for value in values)
+    result = {
+        "concurrency": concurrency,
+        "requests": total,
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 2),
+        "p50_ms": percentile(everything, 0.50),
+        "p95_ms": percentile(everything, 0.95),
+        "p99_ms": percentile(everything, 0.99),
+        "scenarios": {},
+    }
+    for name, values in latencies.items():
+        values.sort()
+        result["scenarios"][name] = {
+            "requests": len(values),
+            "p50_ms": percentile(values, 0.50),
+            "p95_ms": percentile(values, 0.95),
+            "p99_ms": percentile(values, 0.99),
+            "statuses": {str(status): count for status, count in statuses[name].items()},
+        }
+    return result
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    print(f"{'concurrency':>11} {'rps':>17} {'p95 ms':>19} {'p99 ms':>19}")
+    old_levels = {level["concurrency"]: level for level in before["levels"]}
+    for level in after["levels"]:
+        old = old_levels.get(level["concurrency"])
+        if not old:
+            continue
+        print(f"{level['concurrency']:>11} {old['rps']:>8} -> {level['rps']:<6} "
+              f"{old['p95_ms']:>9} -> {level['p95_ms']:<7} {old['p99_ms']:>9} -> {level['p99_ms']:<7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests-per-level", type=int, default=200)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="comma separated scenario=weight pairs")
+    parser.add_argument("--gemini-latency", type=float, default=0.8, help="seconds per stub Gemini call")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--db-latency", type=float, default=0.002, help="seconds per stand-in database call")
+    parser.add_argument("--pdf-pages", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two reports and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    random.seed(args.seed)
+    mix = {}
+    for pair in args.mix.split(","):
+        name, weight = pair.split("=")
+        mix[name.strip()] = float(weight)
+
+    install_stubs(
+        SQLiteDatabaseManager(latency=args.db_latency),
+        gemini_latency=args.gemini_latency,
+        gemini_error_rate=args.gemini_error_rate,
+    )
+    from vector import app
+    from history import history_store
+    logging.getLogger().setLevel(logging.WARNING)
+
+    history_store.start()
+    scenarios = Scenarios(args.pdf_pages)
+    levels = [asyncio.run(run_level(app, scenarios, mix, concurrency, args.requests_per_level))
+              for concurrency in args.levels]
+    history_store.stop()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {
+            "mix": mix,
+            "gemini_latency": args.gemini_latency,
+            "gemini_error_rate": args.gemini_error_rate,
+            "db_latency": args.db_latency,
+            "requests_per_level": args.requests_per_level,
+            "pdf_pages": args.pdf_pages,
+            "seed": args.seed,
+        },
+        "levels": levels,
+        # The app runs in this process, so this is the memory of one worker
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
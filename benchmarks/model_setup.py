@@ -0,0 +1,64 @@
+"""
+Per-request Gemini setup overhead before and after models were cached.
+
+"before" repeats what every handler used to do on each request: it calls
+load_dotenv(), genai.configure(), and builds a GenerativeModel with the chat
+context baked into the system prompt. "after" is the cached get_model()
+lookup plus build_conversation(). No network calls are made. By default a
+stub genai is used. Pass --real-genai to time the real client constructor.
+Run from the repository root:
+
+    python -m benchmarks.model_setup
+"""
+import argparse
+import os
+import time
+
+from benchmarks.stubs import install_stubs
+
+PREVIOUS_CHATS = [
+    ("I have a sore throat since two days", "<p>Possible causes include a viral infection.</p>" * 10),
+    ("should I take antibiotics", "<p><strong>Important:</strong> Don't take medicine without consulting a doctor first.</p>" * 5),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--real-genai", action="store_true", help="time the installed google-generativeai client")
+    args = parser.parse_args()
+
+    if args.real_genai:
+        os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    else:
+        install_stubs()
+    from dotenv import load_dotenv
+    import google.generativeai as genai
+    import function_chatbot
+
+    def before():
+        chat_context = "Previous conversation:\n"
+        for i, (prev_question, prev_response) in enumerate(PREVIOUS_CHATS, 1):
+            chat_context += f"User {i}: {prev_question}\n"
+            chat_context += f"Assistant {i}: {prev_response}...\n\n"
+        load_dotenv()
+        genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+        genai.GenerativeModel(
+            model_name="gemini-2.5-flash",
+            system_instruction=f"{function_chatbot.MEDICAL_ASSISTANT_PROMPT}\nchat_context: {chat_context}"
+        )
+
+    def after():
+        function_chatbot.get_model(function_chatbot.MEDICAL_ASSISTANT_PROMPT)
+        function_chatbot.build_conversation(PREVIOUS_CHATS, "what about lozenges?")
+
+    print(f"{'setup':>7} {'us/request':>11}")
+    for name, setup in [("before", before), ("after", after)]:
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            setup()
+        print(f"{name:>7} {(time.perf_counter() - started) / args.requests * 1e6:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
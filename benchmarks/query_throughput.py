@@ -0,0 +1,39 @@
+"""
+/query/ throughput as concurrency grows, against a SQLite stand-in for MySQL.
+
+Each database call sleeps for --db-latency to model the network round trip a
+real MySQL server adds. Run from the repository root:
+
+    python -m benchmarks.query_throughput --pool-size 5
+"""
+import argparse
+import asyncio
+
+from benchmarks.stubs import SQLiteDatabaseManager, install_stubs, drive
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pool-size", type=int, default=5)
+    parser.add_argument("--db-latency", type=float, default=0.005, help="seconds per database call")
+    parser.add_argument("--requests-per-level", type=int, default=200)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    install_stubs(SQLiteDatabaseManager(latency=args.db_latency, pool_size=args.pool_size))
+    from vector import app
+
+    print(f"{'concurrency':>11} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for concurrency in args.levels:
+        elapsed, latencies, _ = asyncio.run(
+            drive(app, "GET", "/query/", concurrency, args.requests_per_level,
+                  params={"user_input": "what is your contact number"})
+        )
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+        print(f"{concurrency:>11} {args.requests_per_level / elapsed:>9.1f} {p50:>8.1f} {p95:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
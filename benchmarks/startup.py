@@ -0,0 +1,87 @@
+"""
+Cold-start benchmark: import time of vector.py and latency of the first requests.
+
+Every trial runs in a fresh interpreter, so nothing is already imported or
+cached. A trial measures four things:
+
+    import       `import vector` (what every uvicorn worker pays before serving)
+    startup      the lifespan startup hook (database pool, history writer)
+    first fixed  the first /query/ answered from the intent table
+    first llm    the first /query/ that reaches the model
+
+It also lists which heavy libraries the import alone loaded. By default
+Gemini and MySQL are stubbed as in the load test; pass --real to use the
+installed clients (needs GEMINI_API_KEY and a reachable database). Run from
+the repository root:
+
+    python -m benchmarks.startup --trials 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ["google.generativeai", "docx", "pypdf", "PIL", "mysql.connector"]
+
+
+def trial(real):
+    """One cold start, run in the child interpreter; prints a JSON line"""
+    import asyncio
+
+    if not real:
+        from benchmarks.stubs import install_stubs
+        install_stubs()
+
+    already_loaded = set(sys.modules)
+    started = time.perf_counter()
+    import vector
+    timings = {"import": time.perf_counter() - started}
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules and name not in already_loaded]
+
+    async def serve():
+        import httpx
+
+        transport = httpx.ASGITransport(app=vector.app)
+        startup_started = time.perf_counter()
+        async with vector.app.router.lifespan_context(vector.app):
+            timings["startup"] = time.perf_counter() - startup_started
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for name, question in [("first fixed", "what is your contact number"),
+                                       ("first llm", "what does a high ESR value mean")]:
+                    request_started = time.perf_counter()
+                    response = await client.get("/query/", params={"user_input": question})
+                    response.raise_for_status()
+                    timings[name] = time.perf_counter() - request_started
+
+    asyncio.run(serve())
+    print(json.dumps({"timings": timings, "loaded_on_import": loaded}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--real", action="store_true", help="use the installed Gemini and MySQL clients")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        trial(args.real)
+        return
+
+    results = []
+    for _ in range(args.trials):
+        command = [sys.executable, "-m", "benchmarks.startup", "--child"] + (["--real"] if args.real else [])
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'phase':>12} {'median ms':>10} {'max ms':>8}")
+    for phase in results[0]["timings"]:
+        values = [result["timings"][phase] * 1000 for result in results]
+        print(f"{phase:>12} {statistics.median(values):>10.1f} {max(values):>8.1f}")
+    print(f"heavy modules loaded by import: {', '.join(results[0]['loaded_on_import']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
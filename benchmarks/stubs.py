@@ -0,0 +1,203 @@
+"""Stand-ins that let the benchmarks boot the API without MySQL or Gemini"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import types
+from contextlib import contextmanager
+
+
+class SQLiteDatabaseManager:
+    """DatabaseManager stand-in backed by SQLite, with a simulated network round trip per call"""
+
+    def __init__(self, path=None, latency=0.0, pool_size=5):
+        self.path = path or os.path.join(tempfile.mkdtemp(prefix="nidhaan-bench-"), "chat.db")
+        self.latency = latency
+        self.pool_size = pool_size
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS chat_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL DEFAULT 'default',
+                    question TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_session_created ON chat_history (session_id, created_at)"
+            )
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def connect_to_database(self):
+        pass
+
+    def migrate(self):
+        pass
+
+    def insert_chat(self, question, response, session_id="default"):
+        with self._slots:
+            self._round_trip()
+            with self._connection() as connection:
+                connection.execute(
+                    "INSERT INTO chat_history (session_id, question, response) VALUES (?, ?, ?)",
+                    (session_id, question, response)
+                )
+
+    def insert_chats(self, rows):
+        with self._slots:
+            self._round_trip()
+            with self._connection() as connection:
+                connection.executemany(
+                    "INSERT INTO chat_history (session_id, question, response, created_at) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+        return True
+
+    def get_recent_chats(self, session_id="default", limit=2):
+        with self._slots:
+            self._round_trip()
+            rows = self._connection().execute(
+                "SELECT question, response FROM chat_history WHERE session_id = ? "
+                "ORDER BY created_at DESC, id DESC LIMIT ?",
+                (session_id, limit)
+            ).fetchall()
+        return list(reversed(rows))
+
+    def get_last_two_chats(self, session_id="default"):
+        return self.get_recent_chats(session_id, 2)
+
+    def clear_chat_history(self, session_id="default", batch_rows=None):
+        with self._slots:
+            self._round_trip()
+            with self._connection() as connection:
+                return connection.execute("DELETE FROM chat_history WHERE session_id = ?", (session_id,)).rowcount
+
+    # Retention: SQLite has no partitions, so expiry is always the batched delete
+    partitioned = False
+
+    @contextmanager
+    def maintenance_lock(self, name="nidhaan_chat_retention"):
+        yield self
+
+    def add_partitions(self, days_ahead=None, connection=None):
+        return 0
+
+    def drop_partitions_before(self, cutoff, connection=None):
+        return 0, 0
+
+    def archive_chats_before(self, cutoff, archive_table, batch_rows=5000, stop=None, connection=None):
+        return 0
+
+    def delete_chats_before(self, cutoff, batch_rows=5000, pause=0.0, stop=None, connection=None):
+        deleted = 0
+        while stop is None or not stop.is_set():
+            with self._slots, self._connection() as connection:
+                count = connection.execute(
+                    "DELETE FROM chat_history WHERE id IN (SELECT id FROM chat_history "
+                    "WHERE created_at < datetime(?, 'unixepoch', 'localtime') ORDER BY id LIMIT ?)",
+                    (cutoff, batch_rows)
+                ).rowcount
+            deleted += count
+            if count < batch_rows:
+                break
+            if pause:
+                time.sleep(pause)
+        return deleted
+
+    def close_connection(self):
+        pass
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class ServiceUnavailable(Exception):
+    """Stands in for google.api_core.exceptions.ServiceUnavailable, which the LLM client retries"""
+    code = 503
+
+
+class FakeGenerativeModel:
+    """Mimics genai.GenerativeModel.generate_content with a fixed latency and an injected error rate"""
+
+    latency = 0.0
+    error_rate = 0.0
+
+    def __init__(self, model_name=None, system_instruction=None, **kwargs):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        if self.error_rate and random.random() < self.error_rate:
+            time.sleep(self.latency / 2)
+            raise ServiceUnavailable("503 The model is overloaded (injected)")
+        if stream:
+            return self._stream()
+        time.sleep(self.latency)
+        return _FakeResponse("<p>This is a stubbed Gemini answer.</p>")
+
+    def _stream(self, chunks=4):
+        for i in range(chunks):
+            time.sleep(self.latency / chunks)
+            yield _FakeResponse(f"<p>Stubbed chunk {i + 1}.</p>")
+
+
+def install_stubs(db_manager=None, gemini_latency=0.0, gemini_error_rate=0.0):
+    """Register fake `database` and `google.generativeai` modules before the app is imported"""
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    FakeGenerativeModel.latency = gemini_latency
+    FakeGenerativeModel.error_rate = gemini_error_rate
+
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = FakeGenerativeModel
+    google = sys.modules.setdefault("google", types.ModuleType("google"))
+    google.generativeai = genai
+    sys.modules["google.generativeai"] = genai
+
+    database = types.ModuleType("database")
+    database.db_manager = db_manager or SQLiteDatabaseManager()
+    database.DatabaseManager = SQLiteDatabaseManager
+    database.DEFAULT_SESSION = "default"
+    sys.modules["database"] = database
+    return database.db_manager
+
+
+async def drive(app, method, path, concurrency, total, **request_kwargs):
+    """Send `total` requests with `concurrency` in flight; returns (elapsed seconds, latencies, status codes)"""
+    import asyncio
+    import httpx
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.request(method, path, **request_kwargs)
+                latencies.append(time.perf_counter() - started)
+                return response.status_code
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(one() for _ in range(total)))
+        return time.perf_counter() - started, latencies, statuses
@@ -0,0 +1,79 @@
+"""
+Peak memory per concurrent upload, for the old full read and the new chunked ingestion.
+
+A Starlette UploadFile is built over a spooled temporary file, as the
+multipart parser would produce. --concurrency copies are then read at once.
+"full read" is the old `await file.read()` followed by a size check.
+"chunked" is uploads.read_upload, which hashes the spooled file in place
+and stops at the limit, followed by the one read /upload/ makes of an
+accepted file (the extractors and Gemini need its bytes), so the two only
+differ for rejected uploads. Python heap peaks come from tracemalloc.
+Process RSS is reported too. Run from the repository root:
+
+    python -m benchmarks.upload_memory --size-mb 50 --concurrency 8
+"""
+import argparse
+import asyncio
+import resource
+import tempfile
+import tracemalloc
+
+from starlette.datastructures import UploadFile
+
+from uploads import read_upload, UploadTooLarge, MAX_UPLOAD_BYTES
+
+
+def make_upload(size):
+    backing = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    block = b"%PDF-1.7\n" + b"x" * (1024 * 1024 - 9)
+    written = 0
+    while written < size:
+        written += backing.write(block[: size - written])
+    backing.seek(0)
+    return UploadFile(file=backing, filename="report.pdf")
+
+
+async def full_read(upload):
+    contents = await upload.read()
+    if len(contents) > MAX_UPLOAD_BYTES:
+        return "rejected"
+    return "accepted"
+
+
+async def chunked_read(upload):
+    try:
+        await read_upload(upload)
+    except UploadTooLarge:
+        return "rejected"
+    await upload.read()
+    return "accepted"
+
+
+async def run(reader, size, concurrency):
+    uploads = [make_upload(size) for _ in range(concurrency)]
+    tracemalloc.start()
+    outcomes = await asyncio.gather(*(reader(upload) for upload in uploads))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for upload in uploads:
+        await upload.close()
+    return peak, outcomes[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, nargs="+", default=[2, 8, 50])
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'size MB':>8} {'reader':>10} {'outcome':>9} {'peak MB/upload':>15}")
+    for size_mb in args.size_mb:
+        size = int(size_mb * 1024 * 1024)
+        for name, reader in [("full read", full_read), ("chunked", chunked_read)]:
+            peak, outcome = asyncio.run(run(reader, size, args.concurrency))
+            print(f"{size_mb:>8} {name:>10} {outcome:>9} {peak / args.concurrency / 1024 / 1024:>15.2f}")
+    print(f"process max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import contextvars
+import logging
+import math
+import os
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from response_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Documents longer than this are analysed chunk by chunk instead of in one Gemini call
+MAP_REDUCE_CHARS = int(os.environ.get("DOC_MAP_REDUCE_CHARS", 24000))
+CHUNK_CHARS = int(os.environ.get("DOC_CHUNK_CHARS", 8000))
+MAP_CONCURRENCY = int(os.environ.get("DOC_MAP_CONCURRENCY", 4))
+QUESTION_CHUNKS = int(os.environ.get("DOC_QUESTION_CHUNKS", 4))
+
+# extraction._pdf_text starts every page with a "[Page N]" line
+_PAGE_MARKER = re.compile(r"^\[Page \d+\]$", re.MULTILINE)
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Shared by all requests, so the total number of concurrent chunk calls stays bounded
+_map_pool = ThreadPoolExecutor(max_workers=MAP_CONCURRENCY, thread_name_prefix="doc-map")
+
+
+def _sections(text):
+    """Pages when the text has page markers, otherwise paragraphs, otherwise lines"""
+    starts = [match.start() for match in _PAGE_MARKER.finditer(text)]
+    if len(starts) > 1:
+        bounds = starts[1:] + [len(text)]
+        return [text[start:end].strip() for start, end in zip(starts, bounds)]
+    paragraphs = _PARAGRAPH_BREAK.split(text)
+    return paragraphs if len(paragraphs) > 1 else text.split("\n")
+
+
+def split_document(text, max_chars=None):
+    """
+    Split extracted document text into chunks of at most max_chars, keeping pages (or paragraphs)
+    whole where possible. A section longer than max_chars is split on line boundaries.
+    """
+    max_chars = max_chars or CHUNK_CHARS
+    chunks, current, size = [], [], 0
+    for section in _sections(text):
+        pieces = [section] if len(section) <= max_chars else _split_long(section, max_chars)
+        for piece in pieces:
+            if current and size + len(piece) + 2 > max_chars:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            if piece.strip():
+                current.append(piece)
+                size += len(piece) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _split_long(section, max_chars):
+    pieces, current, size = [], [], 0
+    for line in section.split("\n"):
+        while len(line) > max_chars:
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and size + len(line) + 1 > max_chars:
+            pieces.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+class BM25Index:
+    """Okapi BM25 over document chunks, used to pick the chunks relevant to a question"""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._terms = [Counter(_WORD.findall(chunk.lower())) for chunk in chunks]
+        self._lengths = [sum(terms.values()) for terms in self._terms]
+        self._average_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0
+        frequencies = Counter(term for terms in self._terms for term in terms)
+        count = len(self._terms)
+        self._idf = {term: math.log(1 + (count - df + 0.5) / (df + 0.5)) for term, df in frequencies.items()}
+
+    def search(self, query, k):
+        """Indices of the k best-scoring chunks in document order; chunks sharing no terms are left out"""
+        # Filler words ("is", "my", "the") would match every chunk, so only content words count
+        query_terms = set(normalize_question(query).split()) & self._idf.keys()
+        scored = []
+        for index, terms in enumerate(self._terms):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[index] / (self._average_length or 1))
+            for term in query_terms:
+                tf = terms.get(term)
+                if tf:
+                    score += self._idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                scored.append((score, index))
+        best = sorted(scored, reverse=True)[:k]
+        return sorted(index for _, index in best)
+
+
+def map_chunks(fn, chunks):
+    """
+    Run fn(index, chunk) for every chunk on the shared map pool and return the results in order.
+    If a call fails, chunks that have not started yet are cancelled and the error is raised.
+    """
+    # Each call gets its own copy of the caller's context (request deadline, trace)
+    futures = [_map_pool.submit(contextvars.copy_context().run, fn, index, chunk)
+               for index, chunk in enumerate(chunks)]
+    try:
+        return [future.result() for future in futures]
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
@@ -0,0 +1,137 @@
+import html
+import logging
+import os
+import re
+import threading
+from functools import lru_cache
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+_TAG = re.compile(r"<[^>]+>")
+_SPACE = re.compile(r"\s+")
+_SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+(?=[.,;:!?])")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+# Rough token estimate for Gemini: about four characters of English text per token
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=2048)
+def plain_text(text):
+    """Answer HTML reduced to plain text; cached because the same turns are resent every request"""
+    text = _SPACE.sub(" ", html.unescape(_TAG.sub(" ", text)))
+    return _SPACE_BEFORE_PUNCTUATION.sub("", text).strip()
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate(text, max_chars):
+    """Cut text at a word boundary so it fits in max_chars"""
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars - 1)
+    return text[:cut if cut > 0 else max_chars - 1] + "…"
+
+
+def summarize_turn(question, response):
+    """One summary line for a turn: the question and the first sentence of the answer"""
+    answer = plain_text(response)
+    first_sentence = _SENTENCE_END.split(answer, 1)[0]
+    return f"- Asked: {truncate(plain_text(question), 120)} | Answered: {truncate(first_sentence, 160)}"
+
+
+class Conversation(list):
+    """Recent (question, response) turns, oldest first, plus a rolling summary of older turns"""
+
+    def __init__(self, turns=(), summary=""):
+        super().__init__(turns)
+        self.summary = summary
+
+
+class ContextBuilder:
+    """
+    Builds the Gemini conversation turns for a request within a token budget.
+
+    Previous answers are stripped of HTML and each turn is capped at turn_tokens. Turns are
+    added newest first until the budget is spent; older turns that no longer fit are folded
+    into the summary instead of being sent verbatim, and the summary itself is capped at
+    summary_chars by dropping its oldest lines.
+    """
+
+    def __init__(self, token_budget=None, turn_tokens=None, summary_chars=None):
+        self.token_budget = token_budget or int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1500))
+        self.turn_tokens = turn_tokens or int(os.environ.get("CONTEXT_TURN_TOKENS", 400))
+        self.summary_chars = summary_chars or int(os.environ.get("CONTEXT_SUMMARY_CHARS", 1200))
+
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.context_tokens = 0
+        self.truncated_turns = 0
+        self.summarized_turns = 0
+
+    def fold(self, summary, question, response):
+        """Add a turn to a rolling summary, keeping it within summary_chars"""
+        lines = summary.split("\n") if summary else []
+        lines.append(summarize_turn(question, response))
+        while len(lines) > 1 and sum(len(line) + 1 for line in lines) > self.summary_chars:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    def build(self, previous_chats, message):
+        """Previous chats as alternating user/model turns, followed by the current message parts"""
+        turn_chars = self.turn_tokens * CHARS_PER_TOKEN
+        chats = list(previous_chats or [])
+        summary = getattr(previous_chats, "summary", "")
+        remaining = self.token_budget - estimate_tokens(summary)
+
+        recent = []
+        truncated = 0
+        for prev_question, prev_response in reversed(chats):
+            question = truncate(plain_text(prev_question), turn_chars // 4)
+            response = truncate(plain_text(prev_response), turn_chars - len(question))
+            cost = estimate_tokens(question) + estimate_tokens(response)
+            if cost > remaining:
+                break
+            recent.append((question, response))
+            remaining -= cost
+            truncated += response.endswith("…")
+
+        # Turns that did not fit go into the summary, oldest first
+        summarized = len(chats) - len(recent)
+        for prev_question, prev_response in chats[:summarized]:
+            summary = self.fold(summary, prev_question, prev_response)
+        used = estimate_tokens(summary) + sum(estimate_tokens(q) + estimate_tokens(r) for q, r in recent)
+
+        contents = []
+        if summary:
+            contents.append({"role": "user", "parts": [f"Summary of our earlier conversation:\n{summary}"]})
+            contents.append({"role": "model", "parts": ["Noted, I will keep that in mind."]})
+        for question, response in reversed(recent):
+            contents.append({"role": "user", "parts": [question]})
+            contents.append({"role": "model", "parts": [response]})
+        parts = message if isinstance(message, list) else [message]
+        contents.append({"role": "user", "parts": parts})
+
+        with self._lock:
+            self.builds += 1
+            self.context_tokens += used
+            self.truncated_turns += truncated
+            self.summarized_turns += summarized
+        return contents
+
+    def stats(self):
+        return {
+            "token_budget": self.token_budget,
+            "builds": self.builds,
+            "avg_context_tokens": round(self.context_tokens / self.builds, 1) if self.builds else 0.0,
+            "truncated_turns": self.truncated_turns,
+            "summarized_turns": self.summarized_turns,
+        }
+
+
+# Global context builder shared by all handlers
+context_builder = ContextBuilder()
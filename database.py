@@ -1,125 +1,520 @@
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, pooling
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 import logging
 import os
+import threading
+import time
+import zlib
 logger = logging.getLogger(__name__)
 from dotenv import load_dotenv
 
+DATABASE_NAME = "chatbot_nidhaan"
+# Used by clients that do not send a session id yet
+DEFAULT_SESSION = "default"
+COMPRESSION_CODECS = ("zlib", "zstd")
+
+
+@lru_cache(maxsize=1)
+def _zstd():
+    """The optional zstandard module, or None when it is not installed"""
+    try:
+        import zstandard
+    except ImportError:
+        logger.warning("zstandard is not installed, compressing chat responses with zlib instead")
+        return None
+    return zstandard
+
+
+def encode_response(text, codec="", min_bytes=0):
+    """
+    A response as stored: (bytes, codec). Responses shorter than min_bytes, or that do not
+    shrink, are stored as plain UTF-8 with codec "".
+    """
+    data = text.encode("utf-8")
+    if codec not in COMPRESSION_CODECS or len(data) < min_bytes:
+        return data, ""
+    if codec == "zstd" and _zstd() is not None:
+        packed = _zstd().ZstdCompressor(level=3).compress(data)
+    else:
+        codec, packed = "zlib", zlib.compress(data, 6)
+    return (packed, codec) if len(packed) < len(data) else (data, "")
+
+
+def decode_response(data, codec):
+    """Response text from a stored (bytes, codec) pair"""
+    if codec == "zlib":
+        data = zlib.decompress(data)
+    elif codec == "zstd":
+        data = _zstd().ZstdDecompressor().decompress(data)
+    return data.decode("utf-8") if isinstance(data, (bytes, bytearray)) else data
+
+
+def _day_start(day):
+    """Unix time of midnight UTC starting `day`; chat_history partitions hold one UTC day each"""
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+
+def _utc_today():
+    return datetime.now(timezone.utc).date()
+
+
+def _daily_partitions(first_day, last_day):
+    """Partition definitions for first_day..last_day, one per day"""
+    definitions = []
+    day = first_day
+    while day <= last_day:
+        definitions.append(f"PARTITION p{day:%Y%m%d} VALUES LESS THAN ({_day_start(day + timedelta(days=1))})")
+        day += timedelta(days=1)
+    return definitions
+
 
 class DatabaseManager:
-    def __init__(self):
-        self.connection = None
-        self.connect_to_database()
-        self.create_database_and_table()
+    """
+    Pooled MySQL access. Nothing connects at construction: the pool is opened on first use
+    (or by connect_to_database() in the app's startup hook), so the module is cheap to import
+    and safe to import before uvicorn forks workers. Schema changes are a separate step,
+    migrate(), run once per deployment with `python database.py`.
 
-    def connect_to_database(self):
-        """Connect to MySQL server"""
+    When retention is configured (CHAT_RETENTION_DAYS), chat_history is range-partitioned by
+    UTC day on created_at, so expiry drops whole partitions instead of deleting rows; see
+    retention.py. Session lookups cannot prune partitions and probe each one, so the table
+    is only partitioned when the window keeps their number bounded (CHAT_PARTITIONING
+    overrides this). Responses can be stored compressed (CHAT_COMPRESSION=zlib or zstd);
+    reads handle either form.
+    """
+
+    def __init__(self, pool_size=None, database=None, partitioned=None, compression=None):
         load_dotenv()
+        self.pool_size = pool_size or int(os.environ.get("DB_POOL_SIZE", 5))
+        self.database = database or DATABASE_NAME
+        if partitioned is None:
+            retention = int(os.environ.get("CHAT_RETENTION_DAYS", 0)) > 0
+            partitioned = os.environ.get("CHAT_PARTITIONING", str(retention)).lower() in ("1", "true", "yes")
+        self.partitioned = partitioned
+        self.compression = (compression if compression is not None else os.environ.get("CHAT_COMPRESSION", "")).lower()
+        self.compress_min_bytes = int(os.environ.get("CHAT_COMPRESS_MIN_BYTES", 512))
+        self.partitions_ahead = int(os.environ.get("CHAT_PARTITIONS_AHEAD", 3))
+        self.pool = None
+        self._pool_lock = threading.Lock()
+        # mysql.connector pools raise immediately when exhausted, so callers
+        # wait on this semaphore for a free connection instead
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        # Connections must never be shared across processes; a forked worker opens its own pool
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self.pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+
+    def _connection_config(self):
+        return {
+            "host": os.environ.get("DATABASE_HOST", "localhost"),
+            "user": os.environ.get("DATABASE_USER", "root"),  # Default XAMPP MySQL username
+            "password": os.environ['DATABASE_PASS'],
+            "port": int(os.environ.get("DATABASE_PORT", 3306)),
+        }
+
+    def connect_to_database(self):
+        """Open the connection pool if it is not open yet (the database must already exist, see migrate)"""
+        with self._pool_lock:
+            if self.pool is not None:
+                return
+            try:
+                self.pool = pooling.MySQLConnectionPool(
+                    pool_name=f"nidhaan_pool_{self.database}",
+                    pool_size=self.pool_size,
+                    pool_reset_session=True,
+                    database=self.database,
+                    **self._connection_config()
+                )
+                logger.info(f"Connected to MySQL server successfully (pool size {self.pool_size})")
+            except Error as e:
+                logger.error(f"Error connecting to MySQL: {e}")
+                raise e
+
+    def migrate(self, first_day=None):
+        """One-time schema setup: create the database, then the table and any missing columns"""
         try:
-            self.connection = mysql.connector.connect(
-                host='localhost',
-                user='root',  # Default XAMPP MySQL username
-                password=os.environ['DATABASE_PASS'],  # Default XAMPP MySQL password (empty)
-                port=3306
-            )
-            logger.info("Connected to MySQL server successfully")
+            # The pool is bound to the database, so it has to exist first
+            bootstrap = mysql.connector.connect(**self._connection_config())
+            cursor = bootstrap.cursor()
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.database}")
+            cursor.close()
+            bootstrap.close()
         except Error as e:
-            logger.error(f"Error connecting to MySQL: {e}")
+            logger.error(f"Error creating database: {e}")
             raise e
+        self.create_database_and_table(first_day)
 
-    def create_database_and_table(self):
-        """Create database and table if they don't exist"""
-        try:
-            cursor = self.connection.cursor()
-
-            # Create database if not exists
-            cursor.execute("CREATE DATABASE IF NOT EXISTS chatbot_nidhaan")
-            cursor.execute("USE chatbot_nidhaan")
-
-            # Create table if not exists
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS chat_history (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    question TEXT NOT NULL,
-                    response TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+    @contextmanager
+    def get_connection(self):
+        """Borrow a pooled connection, reconnecting it if the server dropped it"""
+        if self.pool is None:
+            self.connect_to_database()
+        with self._slots:
+            connection = self.pool.get_connection()
+            try:
+                connection.ping(reconnect=True, attempts=3, delay=1)
+                yield connection
+            finally:
+                # Returns the connection to the pool
+                connection.close()
+
+    def _partition_clause(self, first_day=None):
+        """PARTITION BY clause for a new chat_history: older rows, first_day..CHAT_PARTITIONS_AHEAD days on, the rest"""
+        first_day = first_day or _utc_today()
+        definitions = [f"PARTITION pold VALUES LESS THAN ({_day_start(first_day)})"]
+        definitions += _daily_partitions(first_day, _utc_today() + timedelta(days=self.partitions_ahead))
+        definitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        return "PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) (\n" + ",\n".join(definitions) + "\n)"
+
+    def _column_count(self, cursor, column):
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'chat_history' AND COLUMN_NAME = %s
+        """, (self.database, column))
+        return cursor.fetchone()[0]
 
-            self.connection.commit()
+    def create_database_and_table(self, first_day=None):
+        """
+        Create the table if it doesn't exist and bring older tables up to date: per-session
+        columns, binary responses with a codec column, a primary key that includes created_at
+        (required for partitioning) and daily partitions. Upgrading a large unpartitioned
+        table rebuilds it once, so run migrate() in a quiet period.
+        """
+        try:
+            with self.get_connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    # (session_id, created_at) serves each session's latest turns from the index
+                    cursor.execute(f"""
+                        CREATE TABLE IF NOT EXISTS chat_history (
+                            id BIGINT NOT NULL AUTO_INCREMENT,
+                            session_id VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_SESSION}',
+                            question TEXT NOT NULL,
+                            response MEDIUMBLOB NOT NULL,
+                            response_codec VARCHAR(8) NOT NULL DEFAULT '',
+                            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                            PRIMARY KEY (id, created_at),
+                            INDEX idx_session_created (session_id, created_at)
+                        ) {self._partition_clause(first_day) if self.partitioned else ""}
+                    """)
+                    if self._column_count(cursor, "session_id") == 0:
+                        logger.info("Adding session_id column to chat_history")
+                        cursor.execute(f"""
+                            ALTER TABLE chat_history
+                            ADD COLUMN session_id VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_SESSION}' AFTER id,
+                            ADD INDEX idx_session_created (session_id, created_at)
+                        """)
+                    if self._column_count(cursor, "response_codec") == 0:
+                        logger.info("Storing chat_history responses as binary with a codec column")
+                        cursor.execute("""
+                            ALTER TABLE chat_history
+                            MODIFY response MEDIUMBLOB NOT NULL,
+                            ADD COLUMN response_codec VARCHAR(8) NOT NULL DEFAULT '' AFTER response
+                        """)
+                    cursor.execute("""
+                        SELECT COUNT(*) FROM information_schema.KEY_COLUMN_USAGE
+                        WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'chat_history'
+                        AND CONSTRAINT_NAME = 'PRIMARY' AND COLUMN_NAME = 'created_at'
+                    """, (self.database,))
+                    if cursor.fetchone()[0] == 0:
+                        # Every unique key of a partitioned table must contain the partitioning column
+                        logger.info("Adding created_at to the chat_history primary key")
+                        cursor.execute("UPDATE chat_history SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+                        cursor.execute("""
+                            ALTER TABLE chat_history
+                            MODIFY id BIGINT NOT NULL AUTO_INCREMENT,
+                            MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                            DROP PRIMARY KEY,
+                            ADD PRIMARY KEY (id, created_at)
+                        """)
+                    if self.partitioned and not self._partitions(cursor):
+                        logger.info("Partitioning chat_history by day, this copies the table once")
+                        cursor.execute(f"ALTER TABLE chat_history {self._partition_clause()}")
+                    connection.commit()
+                finally:
+                    cursor.close()
             logger.info("Database and table created/verified successfully")
 
         except Error as e:
             logger.error(f"Error creating database/table: {e}")
             raise e
-        finally:
-            if cursor:
-                cursor.close()
 
-    def insert_chat(self, question, response):
+    def _encode(self, response):
+        return encode_response(response, self.compression, self.compress_min_bytes)
+
+    def insert_chat(self, question, response, session_id=DEFAULT_SESSION):
         """Insert chat data into database"""
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("USE chatbot_nidhaan")
-
-            query = "INSERT INTO chat_history (question, response) VALUES (%s, %s)"
-            cursor.execute(query, (question, response))
-
-            self.connection.commit()
+            with self.get_connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    query = """
+                        INSERT INTO chat_history (session_id, question, response, response_codec)
+                        VALUES (%s, %s, %s, %s)
+                    """
+                    cursor.execute(query, (session_id, question, *self._encode(response)))
+                    connection.commit()
+                finally:
+                    cursor.close()
             logger.info("Chat data inserted successfully")
 
         except Error as e:
             logger.error(f"Error inserting chat data: {e}")
-        finally:
-            if cursor:
-                cursor.close()
 
-    def get_last_two_chats(self):
-        """Get the last two chat entries"""
+    def insert_chats(self, rows):
+        """Insert many (session_id, question, response, created_at) rows in one round trip"""
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("USE chatbot_nidhaan")
+            encoded = [(session_id, question, *self._encode(response), created_at)
+                       for session_id, question, response, created_at in rows]
+            with self.get_connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    query = """
+                        INSERT INTO chat_history (session_id, question, response, response_codec, created_at)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """
+                    cursor.executemany(query, encoded)
+                    connection.commit()
+                finally:
+                    cursor.close()
+            logger.info(f"Inserted {len(rows)} chat rows")
+            return True
 
-            query = """
-                SELECT question, response FROM chat_history 
-                ORDER BY created_at DESC 
-                LIMIT 2
-            """
-            cursor.execute(query)
-            results = cursor.fetchall()
+        except Error as e:
+            logger.error(f"Error inserting chat rows: {e}")
+            return False
+
+    def get_recent_chats(self, session_id=DEFAULT_SESSION, limit=2):
+        """Get the latest chat entries of a session, oldest first"""
+        try:
+            with self.get_connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    query = """
+                        SELECT question, response, response_codec FROM chat_history
+                        WHERE session_id = %s
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT %s
+                    """
+                    cursor.execute(query, (session_id, limit))
+                    results = cursor.fetchall()
+                finally:
+                    cursor.close()
 
             # Reverse to get chronological order (oldest first)
-            return list(reversed(results))
+            return [(question, decode_response(response, codec)) for question, response, codec in reversed(results)]
 
         except Error as e:
             logger.error(f"Error fetching chat history: {e}")
             return []
-        finally:
-            if cursor:
-                cursor.close()
 
-    def clear_chat_history(self):
-        """Clear all chat history"""
-        try:
-            cursor = self.connection.cursor()
-            cursor.execute("USE chatbot_nidhaan")
+    def get_last_two_chats(self, session_id=DEFAULT_SESSION):
+        """Get the last two chat entries of a session"""
+        return self.get_recent_chats(session_id, 2)
 
-            cursor.execute("DELETE FROM chat_history")
-            self.connection.commit()
-            logger.info("Chat history cleared successfully")
+    def clear_chat_history(self, session_id=DEFAULT_SESSION, batch_rows=None):
+        """
+        Clear the chat history of a session, batch_rows rows per statement and commit, so a
+        long history never holds its locks for one long transaction. Returns the rows deleted.
+        """
+        batch_rows = batch_rows or int(os.environ.get("CHAT_DELETE_BATCH", 5000))
+        deleted = 0
+        try:
+            with self.get_connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    while True:
+                        cursor.execute("DELETE FROM chat_history WHERE session_id = %s LIMIT %s", (session_id, batch_rows))
+                        connection.commit()
+                        deleted += cursor.rowcount
+                        if cursor.rowcount < batch_rows:
+                            break
+                finally:
+                    cursor.close()
+            logger.info(f"Chat history cleared for session {session_id} ({deleted} rows)")
 
         except Error as e:
             logger.error(f"Error clearing chat history: {e}")
-        finally:
-            if cursor:
+        return deleted
+
+    def _partitions(self, cursor):
+        """chat_history partitions as (name, upper bound in Unix time or None for MAXVALUE), oldest first"""
+        cursor.execute("""
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'chat_history' AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """, (self.database,))
+        return [(name, None if bound == "MAXVALUE" else int(bound)) for name, bound in cursor.fetchall()]
+
+    @contextmanager
+    def _borrowed(self, connection=None):
+        """The given connection, or a pooled one for the duration; maintenance under the lock passes its own"""
+        if connection is not None:
+            yield connection
+        else:
+            with self.get_connection() as connection:
+                yield connection
+
+    def add_partitions(self, days_ahead=None, connection=None):
+        """
+        Make sure daily partitions exist up to days_ahead days from now by splitting them off the
+        empty pmax partition, so new rows never pile up there. Returns the partitions added.
+        """
+        days_ahead = self.partitions_ahead if days_ahead is None else days_ahead
+        with self._borrowed(connection) as connection:
+            cursor = connection.cursor()
+            try:
+                partitions = self._partitions(cursor)
+                bounds = [bound for _, bound in partitions if bound is not None]
+                if not partitions or partitions[-1][0] != "pmax" or not bounds:
+                    return 0
+                first_day = datetime.fromtimestamp(max(bounds), timezone.utc).date()
+                definitions = _daily_partitions(first_day, _utc_today() + timedelta(days=days_ahead))
+                if not definitions:
+                    return 0
+                definitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+                cursor.execute(f"ALTER TABLE chat_history REORGANIZE PARTITION pmax INTO ({', '.join(definitions)})")
+            finally:
+                cursor.close()
+        logger.info(f"Added {len(definitions) - 1} chat_history partitions")
+        return len(definitions) - 1
+
+    def drop_partitions_before(self, cutoff, connection=None):
+        """
+        Drop every partition whose rows are all older than cutoff (Unix time): a metadata
+        operation, however many rows they hold. Returns (partitions dropped, approximate rows).
+        """
+        with self._borrowed(connection) as connection:
+            cursor = connection.cursor()
+            try:
+                expired = [name for name, bound in self._partitions(cursor) if bound is not None and bound <= cutoff]
+                if not expired:
+                    return 0, 0
+                cursor.execute(f"""
+                    SELECT COALESCE(SUM(TABLE_ROWS), 0) FROM information_schema.PARTITIONS
+                    WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'chat_history'
+                    AND PARTITION_NAME IN ({', '.join(['%s'] * len(expired))})
+                """, (self.database, *expired))
+                rows = int(cursor.fetchone()[0])
+                cursor.execute(f"ALTER TABLE chat_history DROP PARTITION {', '.join(expired)}")
+            finally:
+                cursor.close()
+        logger.info(f"Dropped chat_history partitions {', '.join(expired)} (~{rows} rows)")
+        return len(expired), rows
+
+    def archive_chats_before(self, cutoff, archive_table, batch_rows=5000, stop=None, connection=None):
+        """
+        Copy rows older than cutoff (Unix time) into archive_table, which is created like
+        chat_history but unpartitioned, batch_rows at a time in id order. Copies are idempotent,
+        so a run interrupted (or stopped by setting the `stop` event) can simply be repeated.
+        Returns the rows copied.
+        """
+        copied = 0
+        last_id = 0
+        with self._borrowed(connection) as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS {archive_table} LIKE chat_history")
+                cursor.execute("""
+                    SELECT COUNT(*) FROM information_schema.PARTITIONS
+                    WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+                """, (self.database, archive_table))
+                if cursor.fetchone()[0]:
+                    cursor.execute(f"ALTER TABLE {archive_table} REMOVE PARTITIONING")
+                while stop is None or not stop.is_set():
+                    cursor.execute("""
+                        SELECT MAX(id), COUNT(*) FROM (
+                            SELECT id FROM chat_history
+                            WHERE created_at < FROM_UNIXTIME(%s) AND id > %s
+                            ORDER BY id LIMIT %s
+                        ) AS expired
+                    """, (cutoff, last_id, batch_rows))
+                    batch_last_id, count = cursor.fetchone()
+                    if not count:
+                        break
+                    cursor.execute(f"""
+                        INSERT IGNORE INTO {archive_table}
+                        SELECT * FROM chat_history
+                        WHERE created_at < FROM_UNIXTIME(%s) AND id > %s AND id <= %s
+                    """, (cutoff, last_id, batch_last_id))
+                    connection.commit()
+                    copied += count
+                    last_id = batch_last_id
+            finally:
                 cursor.close()
+        return copied
+
+    def delete_chats_before(self, cutoff, batch_rows=5000, pause=0.0, stop=None, connection=None):
+        """
+        Delete rows older than cutoff (Unix time) batch_rows at a time in id order, committing
+        and sleeping `pause` seconds between batches so writers are never blocked for long.
+        Setting the `stop` event ends it after the current batch. Returns the rows deleted.
+        """
+        deleted = 0
+        with self._borrowed(connection) as connection:
+            cursor = connection.cursor()
+            try:
+                while stop is None or not stop.is_set():
+                    cursor.execute(
+                        "DELETE FROM chat_history WHERE created_at < FROM_UNIXTIME(%s) ORDER BY id LIMIT %s",
+                        (cutoff, batch_rows)
+                    )
+                    connection.commit()
+                    deleted += cursor.rowcount
+                    if cursor.rowcount < batch_rows:
+                        break
+                    if pause:
+                        time.sleep(pause)
+            finally:
+                cursor.close()
+        return deleted
+
+    @contextmanager
+    def maintenance_lock(self, name="nidhaan_chat_retention"):
+        """
+        Yield the connection holding the server-wide named lock, or None if another worker
+        holds it; lets every worker run the retention job while only one does the work.
+        The maintenance helpers must be given this connection (their `connection` argument),
+        so a pass never needs a second pool slot and cannot deadlock a pool of one.
+        """
+        with self.get_connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT GET_LOCK(%s, 0)", (name,))
+                acquired = cursor.fetchone()[0] == 1
+            finally:
+                cursor.close()
+            try:
+                yield connection if acquired else None
+            finally:
+                if acquired:
+                    cursor = connection.cursor()
+                    try:
+                        cursor.execute("SELECT RELEASE_LOCK(%s)", (name,))
+                        cursor.fetchone()
+                    finally:
+                        cursor.close()
 
     def close_connection(self):
-        """Close database connection"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            logger.info("Database connection closed")
+        """Close all idle pooled connections"""
+        if self.pool:
+            self.pool._remove_connections()
+            logger.info("Database connection pool closed")
+
+
+# Global database manager instance; connects lazily, see DatabaseManager
+db_manager = DatabaseManager()
 
 
-# Global database manager instance
-db_manager = DatabaseManager()
\ No newline at end of file
+if __name__ == "__main__":
+    # Run once per deployment (and after upgrades) before starting the API workers
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    db_manager.migrate()
+    db_manager.close_connection()
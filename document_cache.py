@@ -0,0 +1,79 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+
+class DocumentCache:
+    """
+    Artifacts derived from uploaded documents, keyed by the SHA-256 of the file content, so a
+    re-uploaded report reuses its extracted text, Gemini file handle and first analysis
+    (one per chat history the analysis was written with).
+    Entries are evicted least recently used once their estimated size passes max_bytes, and
+    expire after ttl seconds (Gemini deletes uploaded files after 48 hours).
+    """
+
+    def __init__(self, max_bytes=None, ttl=None):
+        self.max_bytes = max_bytes or int(os.environ.get("DOCUMENT_CACHE_BYTES", 64 * 1024 * 1024))
+        self.ttl = ttl or float(os.environ.get("DOCUMENT_CACHE_TTL", 24 * 3600))
+        self._entries = OrderedDict()  # digest -> {"expires_at", "size", artifact name -> value}
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, digest):
+        """Cached artifacts for a document ("text", "file", "summary", "summary:<history>"), or an empty dict"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry and entry["expires_at"] <= time.monotonic():
+                self._remove(digest)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return {}
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return {name: value for name, value in entry.items() if name not in ("expires_at", "size")}
+
+    def update(self, digest, **artifacts):
+        """Add artifacts to a document's entry, creating it if needed"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                entry = self._entries[digest] = {"expires_at": time.monotonic() + self.ttl, "size": 0}
+            entry.update(artifacts)
+            self.total_bytes -= entry["size"]
+            entry["size"] = sum(
+                len(value) if isinstance(value, str) else sys.getsizeof(value)
+                for name, value in entry.items() if name not in ("expires_at", "size")
+            )
+            self.total_bytes += entry["size"]
+            self._entries.move_to_end(digest)
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, digest):
+        entry = self._entries.pop(digest)
+        self.total_bytes -= entry["size"]
+
+    def stats(self):
+        return {
+            "documents": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# Global cache for uploaded document artifacts
+document_cache = DocumentCache()
@@ -0,0 +1,120 @@
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+PDF_MIME_TYPE = "application/pdf"
+# Types we try to turn into text locally before falling back to a multimodal upload
+EXTRACTABLE_MIME_TYPES = {"text/plain", DOCX_MIME_TYPE, PDF_MIME_TYPE}
+
+# Below this many characters per page a PDF is treated as scanned and sent as a file instead
+MIN_PDF_CHARS_PER_PAGE = int(os.environ.get("PDF_MIN_CHARS_PER_PAGE", 80))
+EXTRACTION_TIMEOUT = float(os.environ.get("EXTRACTION_TIMEOUT", 30))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ExtractionFailed(Exception):
+    """Raised when a document could not be parsed or parsing timed out"""
+
+
+def _docx_text(file_bytes):
+    """Paragraphs and tables of a DOCX in document order; table rows become 'cell | cell' lines"""
+    from docx import Document
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    doc = Document(io.BytesIO(file_bytes))
+    lines = []
+    for child in doc.element.body.iterchildren():
+        tag = child.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            text = Paragraph(child, doc).text.strip()
+            if text:
+                lines.append(text)
+        elif tag == "tbl":
+            for row in Table(child, doc).rows:
+                cells = []
+                for cell in row.cells:
+                    text = cell.text.strip()
+                    # Merged cells repeat the same text across the span
+                    if text and (not cells or cells[-1] != text):
+                        cells.append(text)
+                if cells:
+                    lines.append(" | ".join(cells))
+    return "\n".join(lines)
+
+
+def _pdf_text(file_bytes):
+    """Text layer of a PDF with page markers, or None when it looks scanned or pypdf is missing"""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return None
+
+    reader = PdfReader(io.BytesIO(file_bytes))
+    pages = [(page.extract_text() or "").strip() for page in reader.pages]
+    if not pages or sum(len(page) for page in pages) < MIN_PDF_CHARS_PER_PAGE * len(pages):
+        return None
+    return "\n\n".join(f"[Page {number}]\n{page}" for number, page in enumerate(pages, 1) if page)
+
+
+def extract_document_text(file_bytes, mime_type):
+    """
+    Plain text of a document, or None when it has to go to Gemini as a file
+    (scanned PDFs, unsupported types). Runs inside the extraction process pool.
+    """
+    if mime_type == DOCX_MIME_TYPE:
+        return _docx_text(file_bytes)
+    if mime_type == PDF_MIME_TYPE:
+        return _pdf_text(file_bytes)
+    if mime_type == "text/plain":
+        return file_bytes.decode("utf-8", errors="replace")
+    return None
+
+
+def get_extraction_pool():
+    """Process pool for CPU-bound parsing, created on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = int(os.environ.get("EXTRACTION_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+            # Never fork: the worker already runs threads (history writer, retention job, lanes),
+            # and a forked child can inherit one of their locks held and deadlock on it
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+            logger.info(f"Started document extraction pool with {workers} processes ({method})")
+        return _pool
+
+
+def extract_text(file_bytes, mime_type):
+    """
+    Extract text in the process pool so parsing neither holds the GIL nor blocks other
+    requests. Blocks the calling thread. Returns None when the document has to go to Gemini
+    as a file, and raises ExtractionFailed when parsing fails, which is not the same as a
+    document with no text.
+    """
+    if mime_type not in EXTRACTABLE_MIME_TYPES:
+        return None
+    try:
+        future = get_extraction_pool().submit(extract_document_text, file_bytes, mime_type)
+        return future.result(timeout=EXTRACTION_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Local extraction failed for {mime_type}: {e!r}")
+        raise ExtractionFailed("the document could not be read") from e
+
+
+def shutdown_extraction_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
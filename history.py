@@ -0,0 +1,239 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from dotenv import load_dotenv
+
+from context import Conversation, context_builder
+from database import db_manager
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+
+class HistoryStore:
+    """
+    Recent conversation turns per session, served from memory and persisted write-behind.
+
+    Reads come from a bounded ring buffer per session and only hit MySQL for a session this
+    process has not seen yet (for example after a restart). Turns that fall out of the buffer
+    are folded into a rolling per-session summary, which is seeded on load from up to
+    summary_turns older rows. New turns are queued and written by a background thread in
+    batches with executemany every flush_interval seconds. stop() drains the queue, so a
+    clean shutdown loses nothing.
+
+    The memory tier is private to one process, so it is only correct when every request of a
+    session reaches the same process. With shared=True (several worker processes behind one
+    socket, which gives no session affinity) reads always come from the database, nothing is
+    kept in memory, and each queued turn wakes the writer straight away instead of waiting
+    for the next tick. HISTORY_SHARED defaults to on when WEB_CONCURRENCY is above 1.
+    """
+
+    def __init__(self, db, turns=None, max_sessions=None, flush_interval=None, batch_size=None, max_pending=None,
+                 summary_turns=None, shared=None):
+        self.db = db
+        if shared is None:
+            workers = int(os.environ.get("WEB_CONCURRENCY") or 1)
+            shared = os.environ.get("HISTORY_SHARED", str(workers > 1)).lower() in ("1", "true", "yes")
+        self.shared = shared
+        self.turns = turns or int(os.environ.get("HISTORY_TURNS", 6))
+        self.summary_turns = summary_turns if summary_turns is not None else int(os.environ.get("HISTORY_SUMMARY_TURNS", 8))
+        self.max_sessions = max_sessions or int(os.environ.get("HISTORY_MAX_SESSIONS", 10000))
+        self.flush_interval = flush_interval or float(os.environ.get("HISTORY_FLUSH_INTERVAL", 1.0))
+        self.batch_size = batch_size or int(os.environ.get("HISTORY_FLUSH_BATCH", 500))
+        max_pending = max_pending or int(os.environ.get("HISTORY_MAX_PENDING", 100000))
+
+        self._sessions = OrderedDict()  # session_id -> deque of (question, response)
+        self._summaries = {}  # session_id -> rolling summary of turns older than the deque
+        self._lock = threading.Lock()
+        self._pending = queue.Queue(maxsize=max_pending)  # (session_id, question, response, created_at)
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._writer = None
+
+        self.flushed_rows = 0
+        self.dropped_rows = 0
+        self.flush_errors = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    def start(self):
+        """Start the background writer"""
+        if self._writer and self._writer.is_alive():
+            return
+        self._stop.clear()
+        self._writer = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def stop(self):
+        """Stop the writer and flush everything still queued"""
+        self._stop.set()
+        self._wake.set()
+        if self._writer:
+            self._writer.join()
+        while not self._pending.empty():
+            if not self.flush():
+                break
+        logger.info(f"History writer stopped, {self._pending.qsize()} rows left unflushed")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if not self._stop.is_set():
+                self.flush()
+
+    def get_cached(self, session_id):
+        """Recent turns as a Conversation from memory, or None when the session has not been loaded yet"""
+        if self.shared:
+            # Another worker may have added or cleared turns since this one last saw the session
+            return None
+        with self._lock:
+            turns = self._sessions.get(session_id)
+            if turns is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            return Conversation(turns, self._summaries.get(session_id, ""))
+
+    def load(self, session_id):
+        """Recent turns, loading the session from the database on a miss (blocking)"""
+        cached = self.get_cached(session_id)
+        if cached is not None:
+            return cached
+        # Write queued turns first so the database read sees them
+        if not self._pending.empty():
+            self.flush()
+        rows = self.db.get_recent_chats(session_id, self.turns + self.summary_turns)
+        summary = ""
+        for question, response in rows[:-self.turns]:
+            summary = context_builder.fold(summary, question, response)
+        if self.shared:
+            return Conversation(rows[-self.turns:], summary)
+        with self._lock:
+            turns = self._sessions.get(session_id)
+            if turns is None:
+                turns = self._sessions[session_id] = deque(rows[-self.turns:], maxlen=self.turns)
+                if summary:
+                    self._summaries[session_id] = summary
+                self._evict()
+            return Conversation(turns, self._summaries.get(session_id, ""))
+
+    def _evict(self):
+        while len(self._sessions) > self.max_sessions:
+            session_id, _ = self._sessions.popitem(last=False)
+            self._summaries.pop(session_id, None)
+
+    def _remember(self, session_id, question, response):
+        """Add a turn to the session's ring buffer, folding the oldest into the summary (caller holds _lock)"""
+        if self.shared:
+            return
+        turns = self._sessions.get(session_id)
+        if turns is None:
+            turns = self._sessions[session_id] = deque(maxlen=self.turns)
+            self._evict()
+        if len(turns) == turns.maxlen:
+            oldest_question, oldest_response = turns[0]
+            self._summaries[session_id] = context_builder.fold(
+                self._summaries.get(session_id, ""), oldest_question, oldest_response)
+        turns.append((question, response))
+        self._sessions.move_to_end(session_id)
+
+    def _enqueue(self, row):
+        try:
+            self._pending.put_nowait(row)
+        except queue.Full:
+            self.dropped_rows += 1
+            logger.error(f"History write queue full, dropping turn for session {row[0]}")
+            return
+        if self.shared:
+            # Other workers read this session from the database, so do not hold the turn back
+            self._wake.set()
+
+    def append(self, session_id, question, response):
+        """Record a turn in memory and queue it for the database (never blocks)"""
+        with self._lock:
+            self._remember(session_id, question, response)
+        self._enqueue((session_id, question, response, datetime.now()))
+
+    def append_many(self, session_id, turns):
+        """
+        Record several (question, response) turns of one session and write them with a single
+        bulk insert (blocking). If the database rejects it, the rows go to the background writer.
+        """
+        if not turns:
+            return
+        created_at = datetime.now()
+        rows = [(session_id, question, response, created_at) for question, response in turns]
+        with self._lock:
+            for question, response in turns:
+                self._remember(session_id, question, response)
+        started = time.perf_counter()
+        ok = self.db.insert_chats(rows)
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="history_flush")
+        if not ok:
+            self.flush_errors += 1
+            for row in rows:
+                self._enqueue(row)
+            return
+        self.flushed_rows += len(rows)
+
+    def clear(self, session_id):
+        """Forget a session in memory and delete its rows (blocking)"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._summaries.pop(session_id, None)
+        # Flush first so queued rows for this session cannot land after the delete
+        self.flush()
+        self.db.clear_chat_history(session_id)
+
+    def flush(self):
+        """Write queued turns in batches; returns False if the database rejected a batch"""
+        with self._flush_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._pending.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return True
+
+                started = time.perf_counter()
+                ok = self.db.insert_chats(batch)
+                elapsed = time.perf_counter() - started
+                STAGE_SECONDS.observe(elapsed, stage="history_flush")
+                self.last_flush_seconds = elapsed
+                self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+                if not ok:
+                    # Requeue and retry on the next tick; created_at keeps the original order
+                    self.flush_errors += 1
+                    for row in batch:
+                        try:
+                            self._pending.put_nowait(row)
+                        except queue.Full:
+                            self.dropped_rows += 1
+                    return False
+                self.flushed_rows += len(batch)
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "shared": self.shared,
+            "queue_depth": self._pending.qsize(),
+            "flushed_rows": self.flushed_rows,
+            "dropped_rows": self.dropped_rows,
+            "flush_errors": self.flush_errors,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 3),
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 3),
+        }
+
+
+# Global history store backed by the shared database manager
+history_store = HistoryStore(db_manager)
@@ -0,0 +1,91 @@
+import io
+import logging
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+from extraction import get_extraction_pool
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+IMAGE_MIME_TYPES = {"image/png", "image/jpeg", "image/webp"}
+# Longest side after downscaling; 2048px keeps printed report text legible for OCR
+IMAGE_MAX_SIDE = int(os.environ.get("IMAGE_MAX_SIDE", 2048))
+IMAGE_FORMAT = os.environ.get("IMAGE_FORMAT", "WEBP").upper()
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", 85))
+IMAGE_TIMEOUT = float(os.environ.get("IMAGE_TIMEOUT", 30))
+
+_FORMAT_MIME_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+_stats_lock = threading.Lock()
+_stats = {"images": 0, "bytes_in": 0, "bytes_out": 0, "seconds": 0.0, "failures": 0}
+
+
+def recompress_image(file_bytes, max_side=IMAGE_MAX_SIDE, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    """
+    Auto-orient, downscale and re-encode an image without its EXIF metadata.
+    Returns (bytes, mime_type). Runs inside the worker pool.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(file_bytes)) as image:
+        # Phone photos are often stored sideways with an EXIF orientation flag
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        options = {"quality": quality}
+        if image_format == "WEBP":
+            options["method"] = 4
+        else:
+            options["optimize"] = True
+        output = io.BytesIO()
+        # No exif= argument, so location and device metadata are dropped
+        image.save(output, format=image_format, **options)
+        return output.getvalue(), _FORMAT_MIME_TYPES[image_format]
+
+
+def prepare_image(file_bytes, mime_type):
+    """
+    Shrink an uploaded image in the worker pool before it is sent to Gemini. Returns the
+    original bytes when processing fails or would not make the file smaller.
+    """
+    if mime_type not in IMAGE_MIME_TYPES:
+        return file_bytes, mime_type
+
+    started = time.perf_counter()
+    try:
+        future = get_extraction_pool().submit(recompress_image, file_bytes)
+        processed, processed_type = future.result(timeout=IMAGE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Image preprocessing failed, sending the original: {e}")
+        with _stats_lock:
+            _stats["failures"] += 1
+        return file_bytes, mime_type
+    elapsed = time.perf_counter() - started
+
+    if len(processed) >= len(file_bytes):
+        processed, processed_type = file_bytes, mime_type
+    with _stats_lock:
+        _stats["images"] += 1
+        _stats["bytes_in"] += len(file_bytes)
+        _stats["bytes_out"] += len(processed)
+        _stats["seconds"] += elapsed
+    logger.info(
+        f"Preprocessed image {len(file_bytes)} -> {len(processed)} bytes "
+        f"({len(file_bytes) - len(processed)} saved) in {elapsed * 1000:.1f} ms"
+    )
+    return processed, processed_type
+
+
+def image_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+    stats["seconds"] = round(stats["seconds"], 3)
+    return stats
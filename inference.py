@@ -0,0 +1,140 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from dotenv import load_dotenv
+
+from metrics import QUEUE_SECONDS
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+
+# Absolute perf_counter() time by which the caller stops waiting, set for work running in a lane
+_DEADLINE = contextvars.ContextVar("inference_deadline", default=None)
+
+
+def remaining_time():
+    """Seconds left before the current lane call times out, or None outside a lane"""
+    deadline = _DEADLINE.get()
+    return None if deadline is None else deadline - time.perf_counter()
+
+
+class InferenceOverloaded(Exception):
+    """Raised when every worker is busy and the wait queue is full, or queued work is shed"""
+
+
+class InferenceTimeout(Exception):
+    """Raised when a call does not finish within the configured timeout"""
+
+
+class InferenceGate:
+    """
+    Runs blocking Gemini work on a bounded thread pool so it never blocks the event loop.
+    At most max_concurrency calls run at once and max_queue more may wait; beyond that
+    new calls are rejected straight away instead of piling up. Work that waited longer
+    than max_queue_wait for a worker is shed rather than started, since its caller is
+    likely to time out anyway. Each lane reads its limits from {env_prefix}_* variables.
+    """
+
+    def __init__(self, name="llm", env_prefix="GEMINI", max_concurrency=None, max_queue=None, timeout=None,
+                 max_queue_wait=None, defaults=(8, 32)):
+        self.name = name
+        self.max_concurrency = max_concurrency or int(os.environ.get(f"{env_prefix}_MAX_CONCURRENCY", defaults[0]))
+        if max_queue is None:
+            max_queue = int(os.environ.get(f"{env_prefix}_MAX_QUEUE", defaults[1]))
+        self.max_queue = max_queue
+        self.timeout = timeout or float(os.environ.get(f"{env_prefix}_TIMEOUT", os.environ.get("GEMINI_TIMEOUT", 60)))
+        self.max_queue_wait = max_queue_wait or float(os.environ.get(f"{env_prefix}_MAX_QUEUE_WAIT", self.timeout / 2))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix=name)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.shed = 0
+
+    @property
+    def pending(self):
+        """Calls currently running or waiting for a worker"""
+        return self._pending
+
+    def _admit(self):
+        with self._lock:
+            if self._pending >= self.max_concurrency + self.max_queue:
+                self.rejected += 1
+                raise InferenceOverloaded(f"{self._pending} {self.name} calls already pending")
+            self._pending += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and await its result"""
+        self._admit()
+        # Copy the request context so stage timings in the worker land on this request's trace
+        context = contextvars.copy_context()
+        future = self.executor.submit(context.run, self._dequeued, time.perf_counter(), partial(fn, *args, **kwargs))
+        # The slot is freed when the work actually finishes, not when the caller gives up,
+        # so timed out calls still count against the limit until their thread is free
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Inference call {getattr(fn, '__name__', fn)} timed out after {self.timeout}s")
+            raise InferenceTimeout(f"Inference did not finish within {self.timeout}s")
+
+    def _dequeued(self, submitted, call):
+        """Runs on the worker: record how long the call queued and shed it if it waited too long"""
+        waited = time.perf_counter() - submitted
+        QUEUE_SECONDS.observe(waited, lane=self.name)
+        if waited > self.max_queue_wait:
+            with self._lock:
+                self.shed += 1
+            raise InferenceOverloaded(f"{self.name} call shed after queueing {waited:.1f}s")
+        # The caller gives up self.timeout after submitting, so nothing downstream should outlive that
+        _DEADLINE.set(submitted + self.timeout)
+        return call()
+
+    async def iterate(self, iterator):
+        """
+        Drain a blocking iterator (e.g. a streamed Gemini response) on the pool, yielding items as
+        they arrive. The stream already passed admission in run(), so it is counted but never rejected.
+        """
+        done = object()
+        context = contextvars.copy_context()
+        with self._lock:
+            self._pending += 1
+        try:
+            while True:
+                future = self.executor.submit(context.run, next, iterator, done)
+                try:
+                    item = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+                except asyncio.TimeoutError:
+                    raise InferenceTimeout(f"No streamed output within {self.timeout}s")
+                if item is done:
+                    return
+                yield item
+        finally:
+            self._release()
+
+    def stats(self):
+        return {
+            "pending": self._pending,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "shed": self.shed,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Separate lanes so slow uploads and Gemini questions cannot starve each other;
+# fixed answers never enter a lane (see vector.handle_user_query)
+llm_lane = InferenceGate("llm", "GEMINI")
+upload_lane = InferenceGate("upload", "UPLOAD", defaults=(4, 8))
@@ -0,0 +1,55 @@
+import re
+
+# Intent table, highest priority first. When a question mentions phrases from several
+# intents, the earliest intent in this list wins. Phrases match on whole words only,
+# with an optional plural ending, so "plan" no longer matches "explanation".
+INTENTS = [
+    ("contact", ['contact', 'phone', 'email', 'address', 'reach', 'support']),
+    ("order_medicine", ['order medicine', 'buy medicine', 'purchase medicine', 'how to order', 'medicine delivery']),
+    ("appointment", ['appointment', 'book appointment', 'schedule', 'booking']),
+    ("plans", ['plan', 'healthcare plan', 'subscription', 'package']),
+    ("about", ['about company', 'about nidhaan', 'company details', 'services', 'what is nidhaan']),
+    #("pharmacy", ['pharmacy', 'medicine service', 'drug delivery', 'pharmacy details']),
+    #("doctor_consultation", ['doctor consultation', 'consult doctor', 'doctor service', 'online doctor']),
+    #("lab_tests", ['lab test', 'blood test', 'laboratory', 'health checkup', 'how many lab test']),
+    #("mental_health", ['mental health', 'counseling', 'therapy', 'psychiatrist', 'counselor']),
+    #("greeting", ['hi', 'hello', 'how are you', 'good morning', 'good evening', 'hey']),
+    #("pricing", ['price', 'cost', 'fee', 'charges', 'pricing', 'how much']),
+    #("getting_started", ['how to use', 'getting started', 'first time', 'new user', 'sign up']),
+    ("thanks", ['thank you', 'thanks', 'appreciate', 'grateful']),
+]
+
+
+def _phrase_pattern(phrase):
+    """Regex for one phrase: words separated by any whitespace, last word optionally plural"""
+    words = [re.escape(word) for word in phrase.split()]
+    return r"\s+".join(words) + r"(?:s|es)?"
+
+
+class IntentMatcher:
+    """All intent phrases compiled into one word-boundary regex with a named group per intent"""
+
+    def __init__(self, intents):
+        self.priority = {name: rank for rank, (name, _) in enumerate(intents)}
+        groups = []
+        for name, phrases in intents:
+            # Longest phrases first so "book appointment" wins over "appointment" at the same position
+            alternatives = sorted((_phrase_pattern(p) for p in phrases), key=len, reverse=True)
+            groups.append(f"(?P<{name}>{'|'.join(alternatives)})")
+        # Phrases are lowercase and so are the questions we route, so no IGNORECASE (it halves throughput)
+        self.pattern = re.compile(r"\b(?:" + "|".join(groups) + r")\b")
+
+    def match(self, text):
+        """Return the highest-priority intent mentioned in lowercased text, or None"""
+        best = None
+        for found in self.pattern.finditer(text):
+            if best is None or self.priority[found.lastgroup] < self.priority[best]:
+                best = found.lastgroup
+                if self.priority[best] == 0:
+                    break
+        return best
+
+
+# Compiled once at import
+intent_matcher = IntentMatcher(INTENTS)
+match_intent = intent_matcher.match
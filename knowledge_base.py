@@ -0,0 +1,259 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+from functools import lru_cache
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+KNOWLEDGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge")
+INDEX_VERSION = 1  # bump when embed() or _chunk_text() change, to force a rebuild
+
+_WORD = re.compile(r"[a-z0-9]+")
+_HEADING = re.compile(r"^(#{1,2})\s+(.*)$", re.MULTILINE)
+
+# Words too common in service questions to say anything about which section is meant
+_STOP_WORDS = frozenset(
+    "a an the is are was were be am do does did can could should would will i me my we our us you your "
+    "please tell about of for to in on at it its with and or what whats which how who when where there "
+    "this that have has get any some nidhaan".split()
+)
+
+
+def _features(text):
+    """Hashed bag of words plus character 4-grams, so 'tests' still matches 'test'"""
+    features = {}
+    for word in _WORD.findall(text.lower()):
+        if word in _STOP_WORDS:
+            continue
+        features[word] = features.get(word, 0.0) + 1.0
+        padded = f"<{word}>"
+        for i in range(len(padded) - 3):
+            gram = "#" + padded[i:i + 4]
+            features[gram] = features.get(gram, 0.0) + 0.25
+    return features
+
+
+@lru_cache(maxsize=1 << 16)
+def _slot(feature, dim):
+    """Column and sign of a feature. crc32 is stable across processes (unlike hash()), so vectors
+    saved by one worker are valid in another."""
+    hashed = zlib.crc32(feature.encode("utf-8"))
+    return hashed % dim, 1.0 if hashed & 0x80000000 else -1.0
+
+
+def embed(texts, dim):
+    """L2-normalised feature-hashing vectors for texts, shape (len(texts), dim), float32"""
+    import numpy as np
+
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        vector = vectors[row]
+        for feature, weight in _features(text).items():
+            column, sign = _slot(feature, dim)
+            vector[column] += sign * weight
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize(vectors):
+    """int8 copy of unit vectors (components lie in [-1, 1]); a quarter of the float32 size"""
+    import numpy as np
+
+    return np.clip(np.rint(vectors * 127), -127, 127).astype(np.int8)
+
+
+def build_index(texts, dim, batch_rows=4096):
+    """int8 index rows for texts, embedded a batch at a time so peak memory stays near the index size"""
+    import numpy as np
+
+    index = np.empty((len(texts), dim), dtype=np.int8)
+    for start in range(0, len(texts), batch_rows):
+        index[start:start + batch_rows] = quantize(embed(texts[start:start + batch_rows], dim))
+    return index
+
+
+def top_k(index, query, k, block_rows=2048):
+    """
+    Best (score, row) pairs of an int8 index for a float32 unit query, by cosine similarity.
+    Rows are scored a block at a time, small enough to stay in cache, so a memory-mapped index is
+    never copied whole.
+    """
+    import numpy as np
+
+    scores = np.empty(len(index), dtype=np.float32)
+    for start in range(0, len(index), block_rows):
+        block = np.asarray(index[start:start + block_rows], dtype=np.float32)
+        scores[start:start + len(block)] = block @ query
+    scores /= 127
+    k = min(k, len(scores))
+    if k == 0:
+        return []
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    return [(float(scores[row]), int(row)) for row in best]
+
+
+def load_documents(source_dir):
+    """Sections of every markdown file in source_dir as chunk dicts (source, title, section, text)"""
+    chunks = []
+    for name in sorted(os.listdir(source_dir)):
+        if not name.endswith(".md"):
+            continue
+        with open(os.path.join(source_dir, name), encoding="utf-8") as f:
+            content = f.read()
+        title = os.path.splitext(name)[0].replace("_", " ").title()
+        headings = list(_HEADING.finditer(content))
+        for position, heading in enumerate(headings):
+            end = headings[position + 1].start() if position + 1 < len(headings) else len(content)
+            body = content[heading.end():end].strip()
+            if heading.group(1) == "#":
+                title = heading.group(2).strip()
+            elif body:
+                chunks.append({"source": name, "title": title, "section": heading.group(2).strip(), "text": body})
+    return chunks
+
+
+def _chunk_text(chunk):
+    # A section heading says more about what the section answers than any single body line
+    return f"{chunk['section']} {chunk['section']} {chunk['section']} {chunk['title']} {chunk['text']}"
+
+
+class KnowledgeBase:
+    """
+    Nidhaan service information loaded from markdown files in knowledge/, searchable in-process.
+
+    Every "## " section is one chunk, embedded with feature hashing and stored as an int8 matrix
+    in index_dir/vectors.npy next to the chunk metadata. The files are rebuilt when the sources
+    change and otherwise memory-mapped, so worker processes share one copy through the page
+    cache. A query is answered with a section itself only when it scores at least answer_threshold
+    and beats the next best section by answer_margin, since a medical question that merely shares
+    words with a section ("what medicine for pain relief") must reach Gemini; sections above
+    context_threshold are passed to Gemini as grounding. NumPy is optional:
+    without it the knowledge base stays empty and every question goes to Gemini as before.
+    """
+
+    def __init__(self, source_dir=None, index_dir=None, dim=None, answer_threshold=None, context_threshold=None,
+                 answer_margin=None):
+        self.source_dir = source_dir or os.environ.get("KB_SOURCE_DIR", KNOWLEDGE_DIR)
+        self.index_dir = index_dir or os.environ.get("KB_INDEX_DIR", os.path.join(self.source_dir, ".index"))
+        self.dim = dim or int(os.environ.get("KB_DIM", 1024))
+        self.answer_threshold = answer_threshold or float(os.environ.get("KB_ANSWER_THRESHOLD", 0.6))
+        self.answer_margin = answer_margin if answer_margin is not None else float(os.environ.get("KB_ANSWER_MARGIN", 0.15))
+        self.context_threshold = context_threshold or float(os.environ.get("KB_CONTEXT_THRESHOLD", 0.2))
+        self.context_chunks = int(os.environ.get("KB_CONTEXT_CHUNKS", 3))
+
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._vectors = None
+        self._chunks = []
+        self.answered = 0
+        self.grounded = 0
+
+    def _fingerprint(self):
+        digest = hashlib.sha256(f"{INDEX_VERSION}:{self.dim}".encode())
+        for name in sorted(os.listdir(self.source_dir)):
+            if name.endswith(".md"):
+                digest.update(name.encode("utf-8"))
+                with open(os.path.join(self.source_dir, name), "rb") as f:
+                    digest.update(f.read())
+        return digest.hexdigest()
+
+    def load(self):
+        """Memory-map the saved index, rebuilding it first when the sources changed (blocking)"""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                import numpy as np
+            except ImportError:
+                logger.warning("NumPy is not installed, the knowledge base is disabled")
+                return
+            if not os.path.isdir(self.source_dir):
+                logger.warning(f"Knowledge base directory {self.source_dir} not found")
+                return
+
+            fingerprint = self._fingerprint()
+            vectors_path = os.path.join(self.index_dir, "vectors.npy")
+            meta_path = os.path.join(self.index_dir, "chunks.json")
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                if meta["fingerprint"] != fingerprint:
+                    raise ValueError("knowledge files changed")
+                self._vectors = np.load(vectors_path, mmap_mode="r")
+                self._chunks = meta["chunks"]
+                logger.info(f"Knowledge base loaded: {len(self._chunks)} sections")
+                return
+            except (OSError, ValueError, KeyError) as e:
+                logger.info(f"Rebuilding knowledge base index ({e})")
+
+            chunks = load_documents(self.source_dir)
+            vectors = build_index([_chunk_text(chunk) for chunk in chunks], self.dim)
+            self._save(vectors_path, meta_path, vectors, {"fingerprint": fingerprint, "chunks": chunks})
+            self._vectors = vectors
+            self._chunks = chunks
+            logger.info(f"Knowledge base built: {len(chunks)} sections")
+
+    def _save(self, vectors_path, meta_path, vectors, meta):
+        import numpy as np
+
+        # Write to temporary names and rename, so another worker never maps a half-written file
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            suffix = f".{os.getpid()}.tmp"
+            with open(vectors_path + suffix, "wb") as f:
+                np.save(f, vectors)
+            with open(meta_path + suffix, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(vectors_path + suffix, vectors_path)
+            os.replace(meta_path + suffix, meta_path)
+        except OSError as e:
+            logger.warning(f"Could not save the knowledge base index, keeping it in memory: {e}")
+
+    def search(self, query, k=3):
+        """Best matching sections as (score, chunk) pairs, highest first"""
+        if not self._loaded:
+            self.load()
+        if self._vectors is None or not len(self._chunks):
+            return []
+        query_vector = embed([query], self.dim)[0]
+        return [(score, self._chunks[row]) for score, row in top_k(self._vectors, query_vector, k)]
+
+    def answer(self, query):
+        """The best section as markdown when it matches with high confidence and no close runner-up, else None"""
+        hits = self.search(query, 2)
+        if not hits or hits[0][0] < self.answer_threshold:
+            return None
+        if len(hits) > 1 and hits[0][0] - hits[1][0] < self.answer_margin:
+            return None
+        self.answered += 1
+        chunk = hits[0][1]
+        return f"**{chunk['title']} - {chunk['section']}**\n{chunk['text']}"
+
+    def context(self, query):
+        """Relevant sections as plain text for the prompt, or "" when nothing is close enough"""
+        hits = [chunk for score, chunk in self.search(query, self.context_chunks) if score >= self.context_threshold]
+        if not hits:
+            return ""
+        self.grounded += 1
+        return "\n\n".join(f"{chunk['title']} - {chunk['section']}:\n{chunk['text']}" for chunk in hits)
+
+    def stats(self):
+        return {
+            "sections": len(self._chunks),
+            "index_bytes": int(self._vectors.nbytes) if self._vectors is not None else 0,
+            "answered": self.answered,
+            "grounded": self.grounded,
+        }
+
+
+# Global knowledge base, loaded on first use or by the app's startup hook
+knowledge_base = KnowledgeBase()
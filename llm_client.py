@@ -0,0 +1,229 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+
+from inference import remaining_time
+from metrics import record_stage, record_payload, LLM_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# google.api_core exception names (and HTTP codes) worth retrying: rate limits, overload and timeouts
+_TRANSIENT_ERRORS = frozenset({
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "RetryError",
+})
+_TRANSIENT_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+class LLMUnavailable(Exception):
+    """Raised when Gemini cannot answer in time: circuit open, deadline spent or retries exhausted"""
+
+
+def is_transient(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return type(error).__name__ in _TRANSIENT_ERRORS or getattr(error, "code", None) in _TRANSIENT_CODES
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failed calls and fails fast for reset_timeout
+    seconds. After that a single trial call is let through (half-open); its outcome closes
+    the circuit again or re-opens it.
+    """
+
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        self.failure_threshold = failure_threshold or int(os.environ.get("LLM_BREAKER_FAILURES", 5))
+        self.reset_timeout = reset_timeout or float(os.environ.get("LLM_BREAKER_RESET", 30))
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self.opened = 0
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self):
+        """True when a call may go upstream"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_running:
+                    self.opened += 1
+                    logger.warning(f"Gemini circuit opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+
+class LLMClient:
+    """
+    Shared wrapper around model.generate_content used by every handler.
+
+    Each attempt gets a timeout capped by the request deadline set by the inference lane, so
+    retries never outlive the caller. Transient errors are retried up to `retries` times with
+    exponential backoff and full jitter. Optionally, a non-streamed call still running after
+    the recent p95 latency gets a hedged second request, and whichever answers first wins.
+    A circuit breaker fails calls fast while Gemini keeps failing.
+    """
+
+    def __init__(self, attempt_timeout=None, retries=None, backoff=None, max_backoff=None, hedge=None, breaker=None):
+        self.attempt_timeout = attempt_timeout or float(os.environ.get("LLM_ATTEMPT_TIMEOUT", 30))
+        self.retries = retries if retries is not None else int(os.environ.get("LLM_RETRIES", 2))
+        self.backoff = backoff or float(os.environ.get("LLM_BACKOFF", 0.5))
+        self.max_backoff = max_backoff or float(os.environ.get("LLM_MAX_BACKOFF", 4))
+        if hedge is None:
+            hedge = os.environ.get("LLM_HEDGE", "false").lower() in ("1", "true", "yes")
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+
+        self._latencies = deque(maxlen=200)  # recent successful non-streamed call durations
+        self._hedge_pool = ThreadPoolExecutor(
+            max_workers=int(os.environ.get("LLM_HEDGE_WORKERS", 16)), thread_name_prefix="gemini-hedge"
+        ) if self.hedge else None
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.fast_failures = 0
+
+    def hedge_delay(self):
+        """Recent p95 latency, or None until there are enough samples to trust it"""
+        if len(self._latencies) < 20:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def generate(self, model, contents, stream=False):
+        """Return a Gemini response, raising LLMUnavailable when none can be had in time"""
+        if not self.breaker.allow():
+            self.fast_failures += 1
+            LLM_ATTEMPTS.inc(outcome="circuit_open")
+            raise LLMUnavailable("Gemini circuit is open")
+
+        record_payload(contents)
+        attempt = 0
+        while True:
+            budget = remaining_time()
+            if budget is not None and budget <= 0:
+                self.breaker.record_failure()
+                raise LLMUnavailable("Request deadline passed before Gemini answered")
+            timeout = self.attempt_timeout if budget is None else min(self.attempt_timeout, budget)
+            started = time.perf_counter()
+            try:
+                response = self._attempt(model, contents, stream, timeout)
+            except Exception as e:
+                record_stage("gemini", time.perf_counter() - started)
+                if not is_transient(e):
+                    # Bad requests or blocked prompts say nothing about upstream health
+                    LLM_ATTEMPTS.inc(outcome="error")
+                    self.breaker.record_success()
+                    raise
+                LLM_ATTEMPTS.inc(outcome="transient")
+                if attempt >= self.retries:
+                    self.breaker.record_failure()
+                    raise LLMUnavailable(f"Gemini failed after {attempt + 1} attempts: {e}") from e
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                budget = remaining_time()
+                if budget is not None and delay >= budget:
+                    self.breaker.record_failure()
+                    raise LLMUnavailable(f"No time left to retry Gemini: {e}") from e
+                attempt += 1
+                self.retried += 1
+                logger.info(f"Retrying Gemini in {delay:.2f}s after {type(e).__name__} (attempt {attempt + 1})")
+                time.sleep(delay)
+                continue
+            LLM_ATTEMPTS.inc(outcome="ok")
+            self.breaker.record_success()
+            if stream:
+                # A stream is still being generated when it is returned; time it to the last chunk
+                return self._timed_stream(response, started)
+            record_stage("gemini", time.perf_counter() - started)
+            return response
+
+    @staticmethod
+    def _timed_stream(response, started):
+        """Yield a streamed response's chunks, recording the gemini stage once it ends or is abandoned"""
+        try:
+            yield from response
+        finally:
+            record_stage("gemini", time.perf_counter() - started)
+
+    def _attempt(self, model, contents, stream, timeout):
+        options = {"timeout": timeout}
+        delay = self.hedge_delay() if self.hedge and not stream else None
+        if delay is None or delay >= timeout:
+            started = time.perf_counter()
+            response = model.generate_content(contents, stream=stream, request_options=options)
+            if not stream:
+                self._latencies.append(time.perf_counter() - started)
+            return response
+
+        started = time.perf_counter()
+        finished = []  # futures in the order they complete; `done` sets have no order
+        primary = self._hedge_pool.submit(model.generate_content, contents, request_options=options)
+        primary.add_done_callback(finished.append)
+        done, _ = wait([primary], timeout=delay)
+        if not done:
+            self.hedged += 1
+            hedge = self._hedge_pool.submit(model.generate_content, contents, request_options=options)
+            hedge.add_done_callback(finished.append)
+            done, _ = wait([primary, hedge], timeout=timeout - delay, return_when=FIRST_COMPLETED)
+            # Prefer a successful answer if the first one to finish failed
+            if done and all(future.exception() for future in done):
+                done, _ = wait([primary, hedge], timeout=max(0, timeout - (time.perf_counter() - started)))
+            # A callback can still be pending when wait() returns, so such a future counts as finishing last
+            order = list(finished) + [future for future in (primary, hedge) if future not in finished]
+            winners = [future for future in order if future in done and not future.exception()]
+            if winners:
+                self.hedge_wins += winners[0] is hedge
+                self._latencies.append(time.perf_counter() - started)
+                return winners[0].result()
+            if not done:
+                raise TimeoutError(f"Gemini did not answer within {timeout:.1f}s")
+            raise next(iter(done)).exception()
+        response = primary.result()
+        self._latencies.append(time.perf_counter() - started)
+        return response
+
+    def stats(self):
+        delay = self.hedge_delay()
+        return {
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.opened,
+            "fast_failures": self.fast_failures,
+            "retried": self.retried,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "p95_ms": round(delay * 1000, 1) if delay is not None else None,
+        }
+
+
+# Global client shared by all handlers
+llm_client = LLMClient()
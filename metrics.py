@@ -0,0 +1,154 @@
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", 5))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 10485760)
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_label_text(labels + (('le', '+Inf'),))} {series[-2]}")
+                lines.append(f"{self.name}_count{_label_text(labels)} {series[-2]}")
+                lines.append(f"{self.name}_sum{_label_text(labels)} {series[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("nidhaan_request_seconds", "End-to-end request latency by path")
+STAGE_SECONDS = Histogram("nidhaan_stage_seconds", "Latency of each request stage")
+GEMINI_PAYLOAD_BYTES = Histogram("nidhaan_gemini_payload_bytes", "Size of content sent to Gemini", SIZE_BUCKETS)
+ROUTES = Counter("nidhaan_route_total", "How questions were answered (fixed, knowledge, cache or llm)")
+UPLOAD_TYPES = Counter("nidhaan_upload_total", "Uploads by detected MIME type")
+ERRORS = Counter("nidhaan_errors_total", "Errors by endpoint and kind")
+QUEUE_SECONDS = Histogram("nidhaan_queue_seconds", "Time work waited for a worker, by lane")
+LLM_ATTEMPTS = Counter("nidhaan_llm_attempts_total", "Gemini call attempts by outcome")
+COALESCED = Counter("nidhaan_single_flight_total", "Coalescable requests by role (leader or follower)")
+
+_METRICS = [REQUEST_SECONDS, STAGE_SECONDS, GEMINI_PAYLOAD_BYTES, ROUTES, UPLOAD_TYPES, ERRORS, QUEUE_SECONDS, LLM_ATTEMPTS, COALESCED]
+_stats_sources = {}
+
+# Stage durations of the request being handled, for the slow request log
+_current_trace = contextvars.ContextVar("nidhaan_trace", default=None)
+
+
+def register_stats(prefix, stats_fn):
+    """Export a component's stats() dict as gauges named nidhaan_<prefix>_<key>"""
+    _stats_sources[prefix] = stats_fn
+
+
+def start_trace():
+    trace = {}
+    _current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one request stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def record_stage(name, elapsed):
+    """Add time to a request stage, for work that does not fit one block (e.g. a consumed stream)"""
+    STAGE_SECONDS.observe(elapsed, stage=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace[name] = trace.get(name, 0.0) + elapsed
+
+
+def record_payload(contents):
+    """Observe the approximate size of a Gemini request"""
+    size = 0
+    for content in contents:
+        for part in content.get("parts", ()) if isinstance(content, dict) else (content,):
+            if isinstance(part, str):
+                size += len(part.encode("utf-8"))
+            elif isinstance(part, dict):
+                size += len(part.get("data", b""))
+    GEMINI_PAYLOAD_BYTES.observe(size)
+
+
+def finish_trace(trace, path, elapsed):
+    REQUEST_SECONDS.observe(elapsed, path=path)
+    if elapsed >= SLOW_REQUEST_SECONDS:
+        breakdown = ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in trace.items())
+        logger.warning(f"Slow request {path} took {elapsed * 1000:.1f}ms ({breakdown or 'no stages recorded'})")
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for prefix, stats_fn in _stats_sources.items():
+        for key, value in stats_fn().items():
+            if isinstance(value, (int, float)):
+                name = f"nidhaan_{prefix}_{key}"
+                lines.extend([f"# TYPE {name} gauge", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
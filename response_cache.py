@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Filler words dropped from cache keys. Negations and qualifiers ("not", "low", "high")
+# are deliberately kept because they change the medical meaning of a question.
+_STOP_WORDS = frozenset(
+    "a an the is are was were be what whats which how do does can could should would "
+    "i me my we our you your please tell about of for to in on at it its".split()
+)
+
+def normalize_question(question):
+    """Exact-match key text: lowercase words minus filler, in order, e.g. 'normal blood sugar'"""
+    return " ".join(w for w in _WORD.findall(question.lower()) if w not in _STOP_WORDS)
+
+
+def history_fingerprint(previous_chats):
+    """Digest of a conversation's turns and summary, or "" when there is no history at all"""
+    summary = getattr(previous_chats, "summary", "")
+    if not previous_chats and not summary:
+        return ""
+    digest = hashlib.sha1()
+    digest.update(summary.encode("utf-8"))
+    for prev_question, prev_response in previous_chats:
+        digest.update(prev_question.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(prev_response.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class ResponseCache:
+    """
+    LRU cache of Gemini answers with a TTL, keyed on the normalized question plus the
+    fingerprint of the chat history the answer was generated with. Only answers generated
+    without any history are shared between sessions; anything Gemini wrote with a session's
+    turns in the prompt may depend on them (and contain them), so it is only served back for
+    that exact history. An optional similarity tier also serves answers for questions whose
+    character trigrams overlap a cached question by at least similarity_threshold (Jaccard).
+    The tier is off by default because near-identical wording can still ask a different
+    medical question.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, similarity_threshold=None):
+        self.max_entries = max_entries or int(os.environ.get("RESPONSE_CACHE_SIZE", 1024))
+        self.ttl = ttl or float(os.environ.get("RESPONSE_CACHE_TTL", 3600))
+        if similarity_threshold is None:
+            similarity_threshold = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", 0))
+        self.similarity_threshold = similarity_threshold
+        # (normalized question, history fingerprint) -> (expires_at, answer, trigrams)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, question, previous_chats=None):
+        """Return a cached answer for the question, or None"""
+        normalized = normalize_question(question)
+        fingerprint = history_fingerprint(previous_chats)
+        key = (normalized, fingerprint)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+
+            if self.similarity_threshold > 0 and normalized:
+                answer = self._get_similar(normalized, fingerprint, now)
+                if answer is not None:
+                    self.similar_hits += 1
+                    return answer
+
+            self.misses += 1
+            return None
+
+    def _get_similar(self, normalized, fingerprint, now):
+        grams = _trigrams(normalized)
+        best_key, best_score = None, self.similarity_threshold
+        for key, (expires_at, _, entry_grams) in self._entries.items():
+            if key[1] != fingerprint or expires_at <= now:
+                continue
+            score = len(grams & entry_grams) / len(grams | entry_grams)
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key][1]
+
+    def put(self, question, previous_chats, answer):
+        normalized = normalize_question(question)
+        if not normalized:
+            return
+        key = (normalized, history_fingerprint(previous_chats))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, answer, _trigrams(normalized))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.similar_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Global cache for medical question answers
+response_cache = ResponseCache()
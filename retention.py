@@ -0,0 +1,128 @@
+import calendar
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+from database import db_manager
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+
+class RetentionJob:
+    """
+    Background upkeep of chat_history, run every `interval` seconds by each worker. A MySQL
+    named lock lets only one worker at a time do a pass. A pass:
+
+    1. splits daily partitions off pmax so the next CHAT_PARTITIONS_AHEAD days have their own,
+    2. when retention_days is set, copies expiring rows to archive_table (if set); if that copy
+       is interrupted nothing is expired until a later pass completes it,
+    3. drops partitions older than the cutoff (midnight UTC retention_days ago), and
+    4. deletes any expired rows still left (an unpartitioned table, or the catch-all partition
+       of an upgraded one) in batches of batch_rows with batch_pause seconds between them.
+
+    retention_days=0 keeps history forever, as before, and by default leaves the table
+    unpartitioned (see DatabaseManager); partitions are only maintained when it is partitioned.
+    """
+
+    def __init__(self, db, retention_days=None, interval=None, batch_rows=None, batch_pause=None, archive_table=None):
+        self.db = db
+        self.retention_days = retention_days if retention_days is not None else int(os.environ.get("CHAT_RETENTION_DAYS", 0))
+        self.interval = interval or float(os.environ.get("CHAT_RETENTION_INTERVAL", 3600))
+        self.batch_rows = batch_rows or int(os.environ.get("CHAT_DELETE_BATCH", 5000))
+        self.batch_pause = batch_pause if batch_pause is not None else float(os.environ.get("CHAT_DELETE_PAUSE", 0.05))
+        self.archive_table = archive_table if archive_table is not None else os.environ.get("CHAT_ARCHIVE_TABLE", "")
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.passes = 0
+        self.skipped = 0
+        self.errors = 0
+        self.partitions_added = 0
+        self.partitions_dropped = 0
+        self.rows_archived = 0
+        self.rows_expired = 0
+        self.last_pass_seconds = 0.0
+
+    def start(self):
+        """Start the background thread; the first pass runs right away"""
+        if self._thread and self._thread.is_alive():
+            return
+        if self.db.partitioned and self.retention_days <= 0:
+            logger.warning("chat_history is partitioned but CHAT_RETENTION_DAYS is not set: partitions "
+                           "will accumulate and session lookups slow down as they do")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="chat-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop after the current batch; the next start picks up where this left off"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Chat retention pass failed: {e}")
+            self._stop.wait(self.interval)
+
+    def cutoff(self):
+        """Unix time before which rows expire, or None when history is kept forever"""
+        if self.retention_days <= 0:
+            return None
+        # Partitions hold one UTC day each, so expiring whole days lets them be dropped outright
+        day = datetime.now(timezone.utc).date() - timedelta(days=self.retention_days)
+        return calendar.timegm(day.timetuple())
+
+    def run_once(self):
+        """One maintenance pass (blocking); returns False when another worker holds the lock"""
+        with self.db.maintenance_lock() as connection:
+            if connection is None:
+                self.skipped += 1
+                return False
+            started = time.perf_counter()
+            if self.db.partitioned:
+                self.partitions_added += self.db.add_partitions(connection=connection)
+            cutoff = self.cutoff()
+            if self.archive_table and cutoff is not None:
+                self.rows_archived += self.db.archive_chats_before(
+                    cutoff, self.archive_table, self.batch_rows, self._stop, connection=connection)
+                if self._stop.is_set():
+                    # The copy may have stopped part way; expiring now would destroy rows never archived
+                    cutoff = None
+            if cutoff is not None:
+                if self.db.partitioned:
+                    dropped, rows = self.db.drop_partitions_before(cutoff, connection=connection)
+                    self.partitions_dropped += dropped
+                    self.rows_expired += rows
+                self.rows_expired += self.db.delete_chats_before(
+                    cutoff, self.batch_rows, self.batch_pause, self._stop, connection=connection)
+            self.last_pass_seconds = time.perf_counter() - started
+            STAGE_SECONDS.observe(self.last_pass_seconds, stage="retention_pass")
+            self.passes += 1
+            return True
+
+    def stats(self):
+        return {
+            "retention_days": self.retention_days,
+            "passes": self.passes,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "partitions_added": self.partitions_added,
+            "partitions_dropped": self.partitions_dropped,
+            "rows_archived": self.rows_archived,
+            "rows_expired": self.rows_expired,
+            "last_pass_ms": round(self.last_pass_seconds * 1000, 1),
+        }
+
+
+# Global retention job for the shared database manager, started by the app's startup hook
+retention_job = RetentionJob(db_manager)
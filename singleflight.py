@@ -0,0 +1,154 @@
+import asyncio
+import contextvars
+import logging
+import os
+import queue
+import threading
+from dotenv import load_dotenv
+
+from inference import InferenceTimeout
+from metrics import COALESCED
+from response_cache import normalize_question, history_fingerprint
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+
+def flight_key(kind, question, previous_chats, digest=None):
+    """
+    Key shared by requests that would send Gemini the same prompt: the normalized question,
+    a fingerprint of any chat history (which is part of the prompt, so requests from sessions
+    with different histories never share an answer) and the file digest for uploads.
+    None opts out of coalescing.
+    """
+    normalized = normalize_question(question)
+    if not normalized and digest is None:
+        return None
+    return (kind, digest, normalized, history_fingerprint(previous_chats))
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical requests onto one in-flight handler call.
+
+    The first caller for a key (the leader) starts the call; callers arriving while it is in
+    flight (followers) await the same result instead of starting their own. The call runs as
+    its own task, so any waiter can be cancelled or time out without affecting the others.
+    When the leader gets a streamed answer it still streams; followers receive the full
+    answer once the stream finishes, even if the leader's client went away part way through.
+    Nothing is kept after the call settles, so this adds no cache semantics of its own.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or float(os.environ.get("SINGLE_FLIGHT_TIMEOUT", os.environ.get("GEMINI_TIMEOUT", 60)))
+        self._flights = {}  # key -> future of the shared result, settled once the answer is complete
+        self.leaders = 0
+        self.followers = 0
+        self.follower_timeouts = 0
+
+    async def run(self, key, fn):
+        """Await fn(), a coroutine function returning a handler result, sharing it with callers of the same key"""
+        if key is None:
+            return await fn()
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.followers += 1
+            COALESCED.inc(role="follower")
+            try:
+                return await asyncio.wait_for(asyncio.shield(flight), self.timeout)
+            except asyncio.TimeoutError:
+                self.follower_timeouts += 1
+                raise InferenceTimeout(f"Shared call did not finish within {self.timeout}s")
+
+        loop = asyncio.get_running_loop()
+        flight = self._flights[key] = loop.create_future()
+        flight.add_done_callback(lambda done: self._flights.pop(key, None) if self._flights.get(key) is done else None)
+        self.leaders += 1
+        COALESCED.inc(role="leader")
+
+        async def call():
+            try:
+                response = await fn()
+            except Exception as e:
+                self._settle(flight, error=e)
+                raise
+            if "answer_stream" in response:
+                return {**response, "answer_stream": self._tee(flight, loop, response["answer_stream"])}
+            self._settle(flight, result=response)
+            return response
+
+        task = asyncio.ensure_future(call())
+        # Errors reach followers through the flight, so a leader that went away leaves nothing unretrieved
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return await asyncio.shield(task)
+
+    def _tee(self, flight, loop, chunks):
+        """
+        Drain a streamed answer on its own thread and relay the chunks to the leader through a
+        queue, handing the full answer to followers at the end. The drain does not depend on the
+        leader, so a leader whose client disconnects leaves its followers unaffected.
+        """
+        feed = queue.Queue()
+
+        def drain():
+            parts = []
+            try:
+                for text in chunks:
+                    parts.append(text)
+                    feed.put(("chunk", text))
+            except Exception as e:
+                self._settle_threadsafe(loop, flight, error=e)
+                feed.put(("error", e))
+                return
+            self._settle_threadsafe(loop, flight, result={"answer": "".join(parts)})
+            feed.put(("end", None))
+
+        # Run in the request's context, so stage timings still land in its trace
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(drain,), name="single-flight-stream", daemon=True).start()
+        return self._relay(feed)
+
+    @staticmethod
+    def _relay(feed):
+        """The leader's view of a drained stream; closing it early stops only the relay"""
+        while True:
+            kind, value = feed.get()
+            if kind == "chunk":
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                return
+
+    def _settle_threadsafe(self, loop, flight, result=None, error=None):
+        # Streams are drained on inference worker threads, so settle the future from the loop
+        try:
+            loop.call_soon_threadsafe(self._settle, flight, result, error)
+        except RuntimeError:
+            logger.debug("Event loop closed before a shared answer settled")
+
+    @staticmethod
+    def _settle(flight, result=None, error=None):
+        if flight.done():
+            return
+        if error is None:
+            flight.set_result(result)
+            return
+        flight.set_exception(error)
+        # Mark the exception retrieved so a flight without followers does not log a warning
+        flight.exception()
+
+    def stats(self):
+        requests = self.leaders + self.followers
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "follower_timeouts": self.follower_timeouts,
+            "coalescing_ratio": round(self.followers / requests, 4) if requests else 0.0,
+        }
+
+
+# Global coalescing layer for query and upload requests
+single_flight = SingleFlight()
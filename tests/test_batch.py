@@ -0,0 +1,42 @@
+import asyncio
+
+from benchmarks.stubs import install_stubs
+
+install_stubs()
+
+import batch  # noqa: E402  (needs the stubs in place)
+from context import Conversation  # noqa: E402
+
+
+def answer_all(monkeypatch, questions):
+    """Run answer_batch with Gemini replaced by a handler that echoes the question"""
+    calls = []
+
+    def echo(question, previous_chats, stream=False):
+        calls.append(question)
+        return {"answer": f"answer to {question}"}
+
+    monkeypatch.setattr(batch, "quick_answer", lambda question, previous_chats: None)
+    monkeypatch.setattr(batch, "handle_medical_question", echo)
+
+    async def collect():
+        items = [(question, Conversation()) for question in questions]
+        return dict([pair async for pair in batch.answer_batch(items, concurrency=4)])
+
+    return asyncio.run(collect()), calls
+
+
+def test_questions_without_a_key_are_answered_separately(monkeypatch):
+    results, calls = answer_all(monkeypatch, ["how are you", "is it?", "what is that"])
+
+    assert results[0]["answer"] == "answer to how are you"
+    assert results[1]["answer"] == "answer to is it?"
+    assert results[2]["answer"] == "answer to what is that"
+    assert sorted(calls) == sorted(["how are you", "is it?", "what is that"])
+
+
+def test_duplicate_questions_are_asked_once(monkeypatch):
+    results, calls = answer_all(monkeypatch, ["normal blood sugar", "normal blood sugar"])
+
+    assert results[0] == results[1] == {"answer": "answer to normal blood sugar"}
+    assert calls == ["normal blood sugar"]
@@ -0,0 +1,59 @@
+from benchmarks.stubs import install_stubs
+
+install_stubs()
+
+import function_chatbot  # noqa: E402  (needs the stubs in place)
+from context import Conversation  # noqa: E402
+from document_cache import DocumentCache  # noqa: E402
+from extraction import DOCX_MIME_TYPE, ExtractionFailed  # noqa: E402
+
+
+def failing_extraction(file_bytes, mime_type):
+    raise ExtractionFailed("the document could not be read")
+
+
+def test_failed_extraction_is_an_error_and_is_not_cached(monkeypatch):
+    cache = DocumentCache(max_bytes=1024 * 1024, ttl=60)
+    monkeypatch.setattr(function_chatbot, "document_cache", cache)
+    monkeypatch.setattr(function_chatbot, "extract_text", failing_extraction)
+
+    response = function_chatbot.handle_file_only(b"not really a docx", "report.docx", DOCX_MIME_TYPE, digest="d1")
+
+    assert "failed" in response["answer"]
+    assert "no readable content" not in response["answer"]
+    assert "text" not in cache.get("d1")
+
+
+def test_empty_document_is_cached_as_empty(monkeypatch):
+    cache = DocumentCache(max_bytes=1024 * 1024, ttl=60)
+    monkeypatch.setattr(function_chatbot, "document_cache", cache)
+    monkeypatch.setattr(function_chatbot, "extract_text", lambda file_bytes, mime_type: "")
+
+    response = function_chatbot.handle_file_only(b"", "blank.docx", DOCX_MIME_TYPE, digest="d2")
+
+    assert "no readable content" in response["answer"]
+    assert cache.get("d2")["text"] == ""
+
+
+def test_summary_written_with_history_is_not_served_to_other_sessions(monkeypatch):
+    cache = DocumentCache(max_bytes=1024 * 1024, ttl=60)
+    monkeypatch.setattr(function_chatbot, "document_cache", cache)
+    monkeypatch.setattr(function_chatbot, "extract_text", lambda file_bytes, mime_type: "HbA1c 9.1%")
+    calls = []
+
+    def ask(model, contents, endpoint, stream=False, on_complete=None):
+        answer = f"summary {len(calls)}"
+        calls.append(contents)
+        on_complete(answer)
+        return {"answer": answer}
+
+    monkeypatch.setattr(function_chatbot, "_ask_gemini", ask)
+    alice = Conversation([("I am pregnant", "<p>Noted.</p>")])
+
+    first = function_chatbot.handle_file_only(b"report", "report.txt", "text/plain", alice, digest="d3")
+    other = function_chatbot.handle_file_only(b"report", "report.txt", "text/plain", Conversation(), digest="d3")
+    again = function_chatbot.handle_file_only(b"report", "report.txt", "text/plain", alice, digest="d3")
+
+    assert other["answer"] != first["answer"]
+    assert again["answer"] == first["answer"]
+    assert len(calls) == 2
@@ -0,0 +1,48 @@
+from benchmarks.stubs import install_stubs
+
+install_stubs()
+
+from history import HistoryStore  # noqa: E402  (needs the stubs in place)
+
+
+class SharedDatabase:
+    """chat_history rows in a list, standing in for the MySQL table every worker shares"""
+
+    def __init__(self):
+        self.rows = []
+
+    def get_recent_chats(self, session_id, limit):
+        return [(question, response) for sid, question, response, _ in self.rows if sid == session_id][-limit:]
+
+    def insert_chats(self, rows):
+        self.rows.extend(rows)
+        return True
+
+    def clear_chat_history(self, session_id):
+        self.rows = [row for row in self.rows if row[0] != session_id]
+        return True
+
+
+def test_shared_workers_see_each_others_turns_and_clears():
+    db = SharedDatabase()
+    first, second = HistoryStore(db, shared=True), HistoryStore(db, shared=True)
+
+    assert list(first.load("s1")) == []
+    second.append("s1", "what is hba1c", "<p>A marker of blood sugar.</p>")
+    second.flush()
+    assert first.get_cached("s1") is None
+    assert list(first.load("s1")) == [("what is hba1c", "<p>A marker of blood sugar.</p>")]
+
+    second.clear("s1")
+    assert list(first.load("s1")) == []
+
+
+def test_single_worker_serves_sessions_from_memory():
+    db = SharedDatabase()
+    store = HistoryStore(db, shared=False)
+
+    store.load("s1")
+    store.append("s1", "hello", "<p>Hi.</p>")
+
+    assert list(store.get_cached("s1")) == [("hello", "<p>Hi.</p>")]
+    assert db.rows == []
@@ -0,0 +1,38 @@
+import pytest
+
+from benchmarks.intent_routing import CORPUS
+from knowledge_base import KnowledgeBase
+
+# Medical questions must reach Gemini (and its "consult a doctor" guidance), never a service section
+MEDICAL_QUESTIONS = [question for question, intent in CORPUS if intent is None] + [
+    "what medicine should i take for diabetes",
+    "what medicine for pain relief",
+    "how much does a doctor consultation cost",
+    "which blood test shows thyroid problems",
+    "can i take antibiotics for a cold",
+    "what dose of insulin do i need",
+    "is my anxiety a disorder",
+    "which vitamins help with hair fall",
+]
+
+SERVICE_QUESTIONS = [
+    "how do I book a lab test",
+    "which doctor specialties do you have",
+    "do you have partner labs",
+    "how to book a counseling session",
+]
+
+
+@pytest.fixture(scope="module")
+def knowledge(tmp_path_factory):
+    return KnowledgeBase(index_dir=str(tmp_path_factory.mktemp("kb-index")))
+
+
+@pytest.mark.parametrize("question", MEDICAL_QUESTIONS)
+def test_medical_questions_are_not_answered_from_service_sections(knowledge, question):
+    assert knowledge.answer(question) is None
+
+
+@pytest.mark.parametrize("question", SERVICE_QUESTIONS)
+def test_clear_service_questions_are_answered_directly(knowledge, question):
+    assert knowledge.answer(question) is not None
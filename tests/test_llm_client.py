@@ -0,0 +1,139 @@
+import threading
+import time
+
+import pytest
+
+import inference
+from benchmarks.stubs import FakeGenerativeModel
+from llm_client import CircuitBreaker, LLMClient, LLMUnavailable
+
+
+class CountingModel(FakeGenerativeModel):
+    """FakeGenerativeModel that counts calls and records each attempt's timeout"""
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        super().__init__()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self.timeouts = []
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.timeouts.append(kwargs["request_options"]["timeout"])
+        return super().generate_content(contents, stream=stream, **kwargs)
+
+
+class ScriptedModel:
+    """Each call sleeps and then answers or fails as scripted, in call order"""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        with self._lock:
+            delay, outcome = self.script.pop(0)
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def contents():
+    return [{"role": "user", "parts": ["what does a high ESR mean"]}]
+
+
+def test_circuit_opens_after_consecutive_transient_failures():
+    model = CountingModel(error_rate=1.0)
+    client = LLMClient(retries=0, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60))
+
+    for _ in range(3):
+        with pytest.raises(LLMUnavailable):
+            client.generate(model, contents())
+    assert client.breaker.state == "open"
+
+    with pytest.raises(LLMUnavailable, match="circuit is open"):
+        client.generate(model, contents())
+    assert model.calls == 3
+    assert client.fast_failures == 1
+
+
+def test_half_open_circuit_lets_one_trial_call_through():
+    model = CountingModel(latency=0.1)
+    client = LLMClient(retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+    client.breaker.record_failure()
+    time.sleep(0.06)
+    assert client.breaker.state == "half_open"
+
+    outcomes = []
+
+    def call():
+        try:
+            client.generate(model, contents())
+            outcomes.append("answered")
+        except LLMUnavailable:
+            outcomes.append("failed fast")
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert model.calls == 1
+    assert sorted(outcomes) == ["answered"] + ["failed fast"] * 7
+    assert client.breaker.state == "closed"
+
+
+def test_retries_stop_at_the_request_deadline():
+    model = CountingModel(latency=0.1, error_rate=1.0)
+    client = LLMClient(retries=50, backoff=0.05, max_backoff=0.05, breaker=CircuitBreaker(failure_threshold=100))
+    budget = 0.3
+    token = inference._DEADLINE.set(time.perf_counter() + budget)
+    try:
+        started = time.perf_counter()
+        with pytest.raises(LLMUnavailable):
+            client.generate(model, contents())
+        elapsed = time.perf_counter() - started
+    finally:
+        inference._DEADLINE.reset(token)
+
+    assert elapsed < budget + 0.05
+    assert 1 < model.calls < 50
+    assert all(timeout <= budget for timeout in model.timeouts)
+
+
+def hedging_client():
+    client = LLMClient(retries=0, hedge=True, attempt_timeout=5)
+    # Enough samples for a p95 of 20ms, so a call still running after that gets hedged
+    client._latencies.extend([0.02] * 20)
+    return client
+
+
+def test_hedged_call_returns_the_first_answer():
+    client = hedging_client()
+    model = ScriptedModel((0.5, "slow primary"), (0.0, "fast hedge"))
+
+    started = time.perf_counter()
+    assert client.generate(model, contents()) == "fast hedge"
+    assert time.perf_counter() - started < 0.4
+    assert (client.hedged, client.hedge_wins) == (1, 1)
+
+
+def test_hedged_call_prefers_a_success_over_an_earlier_failure():
+    client = hedging_client()
+    model = ScriptedModel((0.05, ValueError("bad request")), (0.05, "hedge answer"))
+
+    assert client.generate(model, contents()) == "hedge answer"
+    assert client.hedge_wins == 1
+
+
+def test_primary_answer_is_not_counted_as_a_hedge_win():
+    client = hedging_client()
+    model = ScriptedModel((0.05, "primary answer"), (0.3, "late hedge"))
+
+    assert client.generate(model, contents()) == "primary answer"
+    assert (client.hedged, client.hedge_wins) == (1, 0)
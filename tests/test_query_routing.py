@@ -0,0 +1,43 @@
+import asyncio
+
+from benchmarks.stubs import install_stubs
+
+install_stubs()
+
+import httpx  # noqa: E402
+
+import vector  # noqa: E402  (needs the stubs in place)
+from context import Conversation  # noqa: E402
+
+
+def query(monkeypatch, question):
+    """GET /query/ and return (response body, sessions whose history was loaded)"""
+    loaded = []
+
+    async def recent_chats(session_id):
+        loaded.append(session_id)
+        return Conversation()
+
+    monkeypatch.setattr(vector, "recent_chats", recent_chats)
+
+    async def get():
+        transport = httpx.ASGITransport(app=vector.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/query/", params={"user_input": question, "session_id": "s1"})
+            response.raise_for_status()
+            return response.json()
+
+    return asyncio.run(get()), loaded
+
+
+def test_fixed_intents_are_answered_without_loading_history(monkeypatch):
+    body, loaded = query(monkeypatch, "what is your contact number")
+
+    assert body["response"]["answer"]
+    assert loaded == []
+
+
+def test_medical_questions_load_history(monkeypatch):
+    _, loaded = query(monkeypatch, "what does an elevated ALT mean for routing test")
+
+    assert loaded == ["s1"]
@@ -0,0 +1,37 @@
+from context import Conversation
+from response_cache import ResponseCache, normalize_question
+
+QUESTION = "which painkiller is safe for headache"
+
+
+def test_answer_generated_with_history_is_not_served_to_other_sessions():
+    cache = ResponseCache(max_entries=10, ttl=60)
+    alice = Conversation([("I am 30 weeks pregnant and have HIV", "<p>Noted.</p>")])
+    cache.put(QUESTION, alice, "answer written for alice")
+
+    assert cache.get(QUESTION, Conversation()) is None
+    assert cache.get(QUESTION, []) is None
+    assert cache.get(QUESTION, Conversation([("hello", "hi")])) is None
+    assert cache.get(QUESTION, alice) == "answer written for alice"
+
+
+def test_answer_without_history_is_shared():
+    cache = ResponseCache(max_entries=10, ttl=60)
+    cache.put(QUESTION, Conversation(), "general answer")
+
+    assert cache.get(QUESTION, []) == "general answer"
+
+
+def test_summary_alone_counts_as_history():
+    cache = ResponseCache(max_entries=10, ttl=60)
+    cache.put(QUESTION, Conversation([], "Patient is pregnant."), "answer with summary")
+
+    assert cache.get(QUESTION, []) is None
+
+
+def test_normalized_question_keeps_word_order():
+    first = normalize_question("my bp is 120 over 80, is that ok")
+    second = normalize_question("my bp is 80 over 120, is that ok")
+
+    assert first != second
+    assert normalize_question("sugar sugar level") != normalize_question("sugar level")
@@ -0,0 +1,60 @@
+from contextlib import contextmanager
+
+from benchmarks.stubs import install_stubs
+
+install_stubs()
+
+from retention import RetentionJob  # noqa: E402  (needs the stubs in place)
+
+
+class RecordingDatabase:
+    """Retention calls recorded in order; archiving can simulate a shutdown part way through"""
+
+    partitioned = True
+
+    def __init__(self, stop_during_archive=False):
+        self.stop_during_archive = stop_during_archive
+        self.calls = []
+        self.job = None
+
+    @contextmanager
+    def maintenance_lock(self):
+        yield "lock connection"
+
+    def add_partitions(self, days_ahead=None, connection=None):
+        assert connection == "lock connection"
+        self.calls.append("add")
+        return 0
+
+    def archive_chats_before(self, cutoff, archive_table, batch_rows=5000, stop=None, connection=None):
+        assert connection == "lock connection"
+        self.calls.append("archive")
+        if self.stop_during_archive:
+            stop.set()
+        return 10
+
+    def drop_partitions_before(self, cutoff, connection=None):
+        assert connection == "lock connection"
+        self.calls.append("drop")
+        return 1, 100
+
+    def delete_chats_before(self, cutoff, batch_rows=5000, pause=0.0, stop=None, connection=None):
+        assert connection == "lock connection"
+        self.calls.append("delete")
+        return 0
+
+
+def test_expiry_runs_after_a_complete_archive():
+    db = RecordingDatabase()
+    RetentionJob(db, retention_days=30, archive_table="chat_history_archive").run_once()
+
+    assert db.calls == ["add", "archive", "drop", "delete"]
+
+
+def test_interrupted_archive_expires_nothing():
+    db = RecordingDatabase(stop_during_archive=True)
+    job = RetentionJob(db, retention_days=30, archive_table="chat_history_archive")
+    job.run_once()
+
+    assert db.calls == ["add", "archive"]
+    assert job.rows_expired == 0
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import pytest
+
+from context import Conversation
+from singleflight import SingleFlight, flight_key
+
+ALICE = Conversation([("I am 30 weeks pregnant and have HIV", "<p>Noted.</p>")])
+BOB = Conversation([("I have a cold", "<p>Rest well.</p>")])
+
+
+def test_queries_with_different_histories_are_not_coalesced():
+    question = "which painkiller is safe for headache"
+
+    assert flight_key("query", question, ALICE) != flight_key("query", question, BOB)
+    assert flight_key("query", question, ALICE) != flight_key("query", question, Conversation())
+    assert flight_key("query", question, ALICE) == flight_key("query", question, Conversation(ALICE))
+
+
+def test_uploads_without_a_question_include_the_history():
+    digest = "ab" * 32
+
+    assert flight_key("upload", "", ALICE, digest) != flight_key("upload", "", BOB, digest)
+    assert flight_key("upload", "", Conversation(), digest) == flight_key("upload", "", [], digest)
+
+
+def test_followers_get_the_full_answer_when_a_streaming_leader_leaves():
+    flights = SingleFlight(timeout=5)
+    key = flight_key("query", "what does a high ESR mean", Conversation())
+
+    def upstream():
+        for i in range(3):
+            time.sleep(0.02)
+            yield f"part {i}. "
+
+    async def stream():
+        return {"answer_stream": upstream()}
+
+    async def never_called():
+        raise AssertionError("followers must share the leader's call")
+
+    async def scenario():
+        leader = asyncio.ensure_future(flights.run(key, stream))
+        follower = asyncio.ensure_future(flights.run(key, never_called))
+        chunks = (await leader)["answer_stream"]
+        assert next(chunks) == "part 0. "
+        # The leader's client disconnects after the first chunk
+        chunks.close()
+        return await follower
+
+    assert asyncio.run(scenario()) == {"answer": "part 0. part 1. part 2. "}
+
+
+def test_stream_errors_reach_leader_and_followers():
+    flights = SingleFlight(timeout=5)
+    key = flight_key("query", "what does a high ESR mean", Conversation())
+
+    def upstream():
+        yield "part 0. "
+        raise ValueError("upstream failed")
+
+    async def stream():
+        return {"answer_stream": upstream()}
+
+    async def scenario():
+        leader = asyncio.ensure_future(flights.run(key, stream))
+        follower = asyncio.ensure_future(flights.run(key, stream))
+        chunks = (await leader)["answer_stream"]
+        with pytest.raises(ValueError):
+            list(chunks)
+        with pytest.raises(ValueError):
+            await follower
+
+    asyncio.run(scenario())
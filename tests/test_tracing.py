@@ -0,0 +1,57 @@
+import asyncio
+
+from benchmarks.stubs import install_stubs, FakeGenerativeModel
+
+install_stubs()
+
+import httpx  # noqa: E402
+
+import metrics  # noqa: E402
+import vector  # noqa: E402  (needs the stubs in place)
+
+LATENCY = 0.2
+
+
+def record_traces(monkeypatch):
+    """Stream every stubbed Gemini answer over LATENCY seconds and collect (path, elapsed, trace)"""
+    monkeypatch.setattr(FakeGenerativeModel, "latency", LATENCY)
+    finished = []
+    monkeypatch.setattr(metrics, "finish_trace", lambda trace, path, elapsed: finished.append((path, elapsed, dict(trace))))
+    return finished
+
+
+def test_streamed_query_is_timed_until_the_last_chunk(monkeypatch):
+    finished = record_traces(monkeypatch)
+
+    async def stream():
+        transport = httpx.ASGITransport(app=vector.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            params = {"user_input": "what does a high ESR mean for tracing test 1", "stream": True}
+            async with client.stream("GET", "/query/", params=params) as response:
+                return "".join([text async for text in response.aiter_text()])
+
+    assert "event: done" in asyncio.run(stream())
+    path, elapsed, trace = finished[-1]
+    assert path == "/query/"
+    assert elapsed >= LATENCY * 0.9
+    assert trace["gemini"] >= LATENCY * 0.9
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send_json(self, payload):
+        self.frames.append(payload)
+
+
+def test_socket_answer_is_timed_until_the_last_chunk(monkeypatch):
+    finished = record_traces(monkeypatch)
+    socket = RecordingSocket()
+
+    assert asyncio.run(vector.socket_query(socket, "tracing", 1, "what does a high ESR mean for tracing test 2"))
+    assert socket.frames[-1]["event"] == "done"
+    path, elapsed, trace = finished[-1]
+    assert path == "/ws"
+    assert elapsed >= LATENCY * 0.9
+    assert trace["gemini"] >= LATENCY * 0.9
@@ -0,0 +1,30 @@
+import asyncio
+import hashlib
+import tempfile
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from uploads import read_upload, UploadTooLarge
+
+
+def upload(data):
+    backing = tempfile.SpooledTemporaryFile(max_size=1024)
+    backing.write(data)
+    backing.seek(0)
+    return UploadFile(file=backing, filename="report.pdf")
+
+
+def test_upload_is_hashed_in_place_and_rewound():
+    data = b"%PDF-1.7\n" + b"x" * 200_000
+    file = upload(data)
+
+    size, digest = asyncio.run(read_upload(file))
+
+    assert (size, digest) == (len(data), hashlib.sha256(data).hexdigest())
+    assert file.file.read() == data
+
+
+def test_oversized_upload_is_refused_at_the_limit():
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(read_upload(upload(b"x" * 300_000), max_bytes=100_000))
@@ -0,0 +1,60 @@
+import asyncio
+
+from benchmarks.stubs import install_stubs
+
+install_stubs()
+
+import vector  # noqa: E402  (needs the stubs in place)
+
+
+class FakeSocket:
+    """Accepts or refuses the handshake, then disconnects straight away"""
+
+    def __init__(self, origin=None):
+        self.headers = {"origin": origin} if origin else {}
+        self.accepted = False
+        self.close_code = None
+
+    async def accept(self):
+        self.accepted = True
+
+    async def close(self, code=1000, reason=None):
+        self.close_code = code
+
+    async def receive(self):
+        return {"type": "websocket.disconnect"}
+
+
+def connect(monkeypatch, socket, session_id=None):
+    cleared = []
+    monkeypatch.setattr(vector.history_store, "clear", cleared.append)
+    asyncio.run(vector.chat_socket(socket, session_id))
+    return cleared
+
+
+def test_socket_without_session_id_gets_its_own_session(monkeypatch):
+    first, second = FakeSocket(), FakeSocket()
+    cleared = connect(monkeypatch, first) + connect(monkeypatch, second)
+
+    assert first.accepted and second.accepted
+    assert len(set(cleared)) == 2
+    assert vector.DEFAULT_SESSION not in cleared
+
+
+def test_default_session_is_never_cleared(monkeypatch):
+    assert connect(monkeypatch, FakeSocket(), vector.DEFAULT_SESSION) == []
+
+
+def test_unknown_origin_is_refused_before_accept(monkeypatch):
+    socket = FakeSocket(origin="https://evil.example")
+
+    assert connect(monkeypatch, socket, "s1") == []
+    assert not socket.accepted
+    assert socket.close_code == 1008
+
+
+def test_allowed_origin_is_accepted(monkeypatch):
+    socket = FakeSocket(origin=vector.origins[0])
+
+    assert connect(monkeypatch, socket, "s1") == ["s1"]
+    assert socket.accepted
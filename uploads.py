@@ -0,0 +1,135 @@
+import codecs
+import hashlib
+import json
+import logging
+import os
+import zipfile
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from extraction import DOCX_MIME_TYPE
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+MAX_UPLOAD_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 10 * 1024 * 1024))
+CHUNK_BYTES = 64 * 1024
+# Room for multipart boundaries and headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+TOO_LARGE_MESSAGE = f"File too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)}MB"
+
+
+
+class UploadTooLarge(Exception):
+    """Raised as soon as an upload passes the size limit"""
+
+
+async def read_upload(file, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Hash an UploadFile chunk by chunk, stopping as soon as it exceeds max_bytes, then rewind
+    it. Starlette has already spooled the body to a temporary file, so it is read in place
+    rather than copied. Returns (size, sha256 hex digest).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = await file.read(CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(f"{file.filename} is larger than {max_bytes} bytes")
+        digest.update(chunk)
+    await file.seek(0)
+    return size, digest.hexdigest()
+
+
+def sniff_mime_type(fileobj):
+    """Detect a supported file type from its content; returns None when it is not recognised"""
+    head = fileobj.read(512)
+    fileobj.seek(0)
+
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith(b"PK\x03\x04"):
+        # DOCX is a zip archive with the document body at word/document.xml
+        try:
+            with zipfile.ZipFile(fileobj) as archive:
+                is_docx = "word/document.xml" in archive.namelist()
+        except zipfile.BadZipFile:
+            is_docx = False
+        fileobj.seek(0)
+        return DOCX_MIME_TYPE if is_docx else None
+    if head and b"\x00" not in head:
+        try:
+            # Incremental decode so a multi-byte character cut at 512 bytes is not an error
+            codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+            return "text/plain"
+        except UnicodeDecodeError:
+            return None
+    return None
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware that rejects oversized request bodies on the given paths while they are
+    still arriving, before multipart parsing buffers them: an oversized Content-Length is
+    refused outright, and streamed bodies are cut off once they pass the limit.
+    """
+
+    def __init__(self, app, paths, max_bytes=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=TOO_LARGE_MESSAGE)
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except HTTPException as e:
+            if e.status_code != 413 or response_started:
+                raise
+            await self._reject(send)
+
+    async def _reject(self, send):
+        logger.warning("Rejected upload larger than the size limit")
+        body = json.dumps({"detail": TOO_LARGE_MESSAGE}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,12 +1,37 @@
-from fastapi import FastAPI, Query, UploadFile, File, HTTPException
+from fastapi import FastAPI, Query, Request, UploadFile, File, HTTPException, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import Optional, List, Tuple, Union
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import io
+import json
 import logging
 import os
+import time
+import uuid
 from dotenv import load_dotenv
 
-from function_chatbot import handle_fixed_questions, handle_file_upload
-from database import db_manager
+from function_chatbot import local_answer, cached_answer, handle_medical_question, handle_file_upload
+from database import db_manager, DEFAULT_SESSION
+from history import history_store
+from retention import retention_job
+from context import Conversation, context_builder
+from knowledge_base import knowledge_base
+from singleflight import single_flight, flight_key
+from batch import answer_batch, BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY, BATCH_MAX_ITEMS
+from llm_client import llm_client
+from inference import llm_lane, upload_lane, InferenceOverloaded, InferenceTimeout
+from response_cache import response_cache
+from document_cache import document_cache
+from extraction import shutdown_extraction_pool
+from images import image_stats
+import metrics
+from metrics import stage, ERRORS, UPLOAD_TYPES
+from uploads import read_upload, sniff_mime_type, UploadTooLarge, UploadSizeLimitMiddleware, TOO_LARGE_MESSAGE, MAX_UPLOAD_BYTES
 
 # Load environment variables
 load_dotenv()
@@ -15,11 +40,41 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+# Seconds a WebSocket may stay silent before the server closes it and clears its history
+WS_IDLE_TIMEOUT = float(os.environ.get("WS_IDLE_TIMEOUT", 900))
+# WebSocket conversations: open and lifetime connection counts, messages answered
+socket_stats = {"open": 0, "connections": 0, "messages": 0, "rejected_origins": 0}
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Per-worker resources, created after uvicorn has started (or forked) this worker process
+    and released when it stops. Nothing here touches the schema; see database.py.
+    """
+    # Open the database pool now so the first request does not pay for it
+    try:
+        await run_in_threadpool(db_manager.connect_to_database)
+    except Exception as e:
+        logger.error(f"Database not reachable at startup, will retry on first use: {e}")
+    # Map (or build) the knowledge base index before the first question needs it
+    await run_in_threadpool(knowledge_base.load)
+    history_store.start()
+    retention_job.start()
+    yield
+    # Flush pending history, then release inference workers and pooled database connections
+    llm_lane.shutdown()
+    upload_lane.shutdown()
+    shutdown_extraction_pool()
+    await run_in_threadpool(retention_job.stop)
+    await run_in_threadpool(history_store.stop)
+    db_manager.close_connection()
+
 # FastAPI app
 app = FastAPI(
     title="Nidhaan Healthcare API",
     description="API for handling user queries and file uploads",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 origins = [
@@ -39,6 +94,103 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Refuse oversized uploads while the body is still streaming in
+app.add_middleware(UploadSizeLimitMiddleware, paths=["/upload/"])
+
+metrics.register_stats("llm_lane", llm_lane.stats)
+metrics.register_stats("upload_lane", upload_lane.stats)
+metrics.register_stats("llm", llm_client.stats)
+metrics.register_stats("response_cache", response_cache.stats)
+metrics.register_stats("history", history_store.stats)
+metrics.register_stats("retention", retention_job.stats)
+metrics.register_stats("context", context_builder.stats)
+metrics.register_stats("knowledge_base", knowledge_base.stats)
+metrics.register_stats("single_flight", single_flight.stats)
+metrics.register_stats("document_cache", document_cache.stats)
+metrics.register_stats("images", image_stats)
+metrics.register_stats("websocket", lambda: dict(socket_stats))
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """Time each request and log a stage breakdown for slow ones"""
+    trace = metrics.start_trace()
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        metrics.finish_trace(trace, request.url.path, time.perf_counter() - started)
+        raise
+
+    # call_next returns once the headers are ready; streamed answers are still being generated,
+    # so the request ends when the last chunk of the body has been sent
+    body = response.body_iterator
+
+    async def timed_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            metrics.finish_trace(trace, request.url.path, time.perf_counter() - started)
+
+    response.body_iterator = timed_body()
+    return response
+
+def _sse(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def recent_chats(session_id):
+    """Recent turns from memory, falling back to the database for sessions not loaded yet"""
+    with stage("history_lookup"):
+        previous_chats = history_store.get_cached(session_id)
+        if previous_chats is None:
+            previous_chats = await run_in_threadpool(history_store.load, session_id)
+    return previous_chats
+
+async def answer_chunks(response, lane):
+    """Text of a handler result as it is generated: one piece per model chunk, or the whole answer"""
+    if "answer_stream" in response:
+        async for text in lane.iterate(response["answer_stream"]):
+            yield text
+    else:
+        yield response.get("answer", "No response generated")
+
+def stream_response(response, user_input, session_id, lane=llm_lane):
+    """
+    Stream a handler result as Server-Sent Events: "chunk" events carry text as it is generated,
+    then the full answer is saved to history and sent in a final "done" event.
+    """
+    async def events():
+        parts = []
+        try:
+            async for text in answer_chunks(response, lane):
+                parts.append(text)
+                yield _sse("chunk", {"text": text})
+        except Exception as e:
+            ERRORS.inc(endpoint="stream", kind=type(e).__name__)
+            logger.error(f"Error while streaming response: {e}")
+            yield _sse("error", {"detail": "The response was interrupted. Please try again."})
+            return
+
+        response_text = "".join(parts)
+        with stage("history_write"):
+            history_store.append(session_id, user_input, response_text)
+        yield _sse("done", {"answer": response_text})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def session_id_query(default=DEFAULT_SESSION):
+    """Query parameter identifying one browser conversation"""
+    return Query(
+        default,
+        description="Conversation id generated by the client; history is kept per session",
+        pattern=r"^[A-Za-z0-9_-]{1,64}$"
+    )
+
 @app.get("/")
 async def root():
     """Root endpoint to check API status"""
@@ -49,7 +201,11 @@ async def root():
     }
 
 @app.get("/query/")
-async def handle_user_query(user_input: str = Query(..., description="The user's query")):
+async def handle_user_query(
+    user_input: str = Query(..., description="The user's query"),
+    stream: bool = Query(False, description="Stream the answer as Server-Sent Events"),
+    session_id: str = session_id_query()
+):
     """Handle text-only user queries"""
     if not user_input or not user_input.strip():
         raise HTTPException(status_code=400, detail="Query cannot be empty")
@@ -57,74 +213,372 @@ async def handle_user_query(user_input: str = Query(..., description="The user's
         user_input = user_input.strip()
         logger.info(f"Processing text query: {user_input[:50]}...")
         
-        previous_chats = db_manager.get_last_two_chats()
-        response = handle_fixed_questions(user_input, previous_chats)
+        # Fixed intents and service answers need no history, so they skip the session load entirely
+        response = local_answer(user_input)
+        if response is None:
+            previous_chats = await recent_chats(session_id)
+            # Cached answers are served right here, without queueing behind Gemini work
+            response = cached_answer(user_input, previous_chats)
+        if response is None:
+            # Identical questions already in flight share one Gemini call
+            response = await single_flight.run(
+                flight_key("query", user_input, previous_chats),
+                lambda: llm_lane.run(handle_medical_question, user_input, previous_chats, stream=stream)
+            )
+        if stream:
+            return stream_response(response, user_input, session_id)
 
         response_text = response.get("answer", "No response generated")
-        db_manager.insert_chat(user_input, response_text)
+        with stage("history_write"):
+            history_store.append(session_id, user_input, response_text)
         
         return {"response": response}
+    except InferenceOverloaded:
+        ERRORS.inc(endpoint="query", kind="overloaded")
+        raise HTTPException(status_code=429, detail="Too many requests in progress, please retry shortly")
+    except InferenceTimeout:
+        ERRORS.inc(endpoint="query", kind="timeout")
+        raise HTTPException(status_code=504, detail="The assistant took too long to respond")
     except Exception as e:
+        ERRORS.inc(endpoint="query", kind=type(e).__name__)
         logger.error(f"Error processing query: {e}")
         raise HTTPException(status_code=500, detail="Internal server error while processing query")
 
 @app.post("/upload/")
 async def upload_file(
     file: UploadFile = File(...),
-    user_query: Optional[str] = Query(None, description="Optional user query with file")
+    user_query: Optional[str] = Query(None, description="Optional user query with file"),
+    stream: bool = Query(False, description="Stream the answer as Server-Sent Events"),
+    session_id: str = session_id_query()
 ):
     """Handle file uploads with optional text query"""
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
 
     try:
+        # Hash in chunks and stop at the size limit before reading the upload into memory
+        try:
+            size, digest = await read_upload(file)
+        except UploadTooLarge:
+            raise HTTPException(status_code=413, detail=TOO_LARGE_MESSAGE)
+        # Trust the content, not the file name, to decide the type
+        mime_type = sniff_mime_type(file.file) or "application/octet-stream"
+        UPLOAD_TYPES.inc(mime_type=mime_type)
+        # The extractors and Gemini take the document as bytes, so the accepted file is held in memory
         contents = await file.read()
 
-        # Enforce 10MB size limit
-        if len(contents) > 10 * 1024 * 1024:
-            raise HTTPException(status_code=413, detail="File too large. Maximum size is 10MB")
-
-        await file.seek(0)  # Reset file pointer
         query_text = user_query.strip() if user_query else ""
 
-        logger.info(f"Processing file upload: {file.filename}, Query: {'Yes' if query_text else 'No'}")
+        logger.info(f"Processing file upload: {file.filename} ({mime_type}, {size} bytes), Query: {'Yes' if query_text else 'No'}")
 
-        previous_chats = db_manager.get_last_two_chats()
-        response = handle_file_upload(contents, file.filename, query_text, previous_chats)
+        previous_chats = await recent_chats(session_id)
+        response = await single_flight.run(
+            flight_key("upload", query_text, previous_chats, digest),
+            lambda: upload_lane.run(
+                handle_file_upload, contents, file.filename, query_text, previous_chats,
+                stream=stream, mime_type=mime_type, digest=digest
+            )
+        )
 
         # Store in database
         user_input = f"[FILE: {file.filename}]" + (f" {query_text}" if query_text else "")
+        if stream:
+            return stream_response(response, user_input, session_id, upload_lane)
         response_text = response.get("answer", "No response generated")
-        db_manager.insert_chat(user_input, response_text)
+        with stage("history_write"):
+            history_store.append(session_id, user_input, response_text)
 
         return {"response": response}
     except HTTPException:
         raise
+    except InferenceOverloaded:
+        ERRORS.inc(endpoint="upload", kind="overloaded")
+        raise HTTPException(status_code=429, detail="Too many requests in progress, please retry shortly")
+    except InferenceTimeout:
+        ERRORS.inc(endpoint="upload", kind="timeout")
+        raise HTTPException(status_code=504, detail="The assistant took too long to respond")
     except Exception as e:
+        ERRORS.inc(endpoint="upload", kind=type(e).__name__)
         logger.error(f"Error processing file upload: {e}")
         raise HTTPException(status_code=500, detail="Internal server error while processing file")
 
-@app.get("/clear-history/")
-async def clear_chat_history():
-    """Clear all chat history (called when frontend closes or refreshes)"""
+class BatchItem(BaseModel):
+    """One batch question, optionally with the earlier turns it follows"""
+    question: str = Field(..., min_length=1)
+    context: List[Tuple[str, str]] = Field(default_factory=list, description="Earlier (question, answer) turns, oldest first")
+
+class BatchRequest(BaseModel):
+    items: List[Union[str, BatchItem]] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+@app.post("/query/batch")
+async def handle_batch_query(
+    batch: BatchRequest,
+    stream: bool = Query(False, description="Stream results as NDJSON lines in the order they finish"),
+    concurrency: int = Query(BATCH_CONCURRENCY, ge=1, le=BATCH_MAX_CONCURRENCY,
+                             description="Gemini calls this batch keeps in flight"),
+    record: bool = Query(True, description="Save the answers to the session's chat history"),
+    session_id: str = session_id_query("batch")
+):
+    """
+    Answer many questions in one request, for offline tools such as FAQ pre-generation and
+    QA regression runs. Items are plain questions or {"question", "context"} objects. Results
+    come back in item order as {"results": [...]}, or with stream=true as one JSON line per
+    item as soon as it is answered. Answered items are saved with one bulk insert at the end.
+    """
+    items = []
+    for item in batch.items:
+        question = (item if isinstance(item, str) else item.question).strip()
+        if not question:
+            raise HTTPException(status_code=400, detail="Questions cannot be empty")
+        items.append((question, Conversation([] if isinstance(item, str) else item.context)))
+    logger.info(f"Processing batch of {len(items)} questions (concurrency {concurrency})")
+
+    async def results():
+        answered = {}
+        async for index, result in answer_batch(items, concurrency):
+            if "answer" in result:
+                answered[index] = result["answer"]
+            yield {"index": index, "question": items[index][0], **result}
+        if record and answered:
+            turns = [(items[index][0], answered[index]) for index in sorted(answered)]
+            with stage("history_write"):
+                await run_in_threadpool(history_store.append_many, session_id, turns)
+
+    if stream:
+        async def lines():
+            async for result in results():
+                yield json.dumps(result) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    ordered = [result async for result in results()]
+    ordered.sort(key=lambda result: result["index"])
+    return {"results": ordered}
+
+async def _send(websocket, payload):
+    """Send one JSON frame; returns False once the client has gone away"""
+    try:
+        await websocket.send_json(payload)
+        return True
+    except Exception:
+        # The closed-connection error type depends on the server's WebSocket backend
+        return False
+
+def _socket_error(e):
+    """Error kind and client-facing detail for a failed socket turn, matching the HTTP endpoints"""
+    if isinstance(e, InferenceOverloaded):
+        return "overloaded", "Too many requests in progress, please retry shortly"
+    if isinstance(e, InferenceTimeout):
+        return "timeout", "The assistant took too long to respond"
+    return type(e).__name__, "The response was interrupted. Please try again."
+
+async def socket_turn(websocket, session_id, message_id, user_input, respond, lane):
+    """
+    Answer one socket message: await respond() for the handler result, stream its text as
+    "chunk" frames, record the turn and finish with a "done" frame (or an "error" frame).
+    Returns False when the client disconnected mid-answer.
+    """
+    trace = metrics.start_trace()
+    started = time.perf_counter()
+    parts = []
     try:
-        db_manager.clear_chat_history()
+        response = await respond()
+        async for text in answer_chunks(response, lane):
+            parts.append(text)
+            if not await _send(websocket, {"id": message_id, "event": "chunk", "text": text}):
+                return False
+    except Exception as e:
+        kind, detail = _socket_error(e)
+        ERRORS.inc(endpoint="ws", kind=kind)
+        logger.error(f"Error answering WebSocket message: {e}")
+        return await _send(websocket, {"id": message_id, "event": "error", "detail": detail})
+    finally:
+        metrics.finish_trace(trace, "/ws", time.perf_counter() - started)
+
+    response_text = "".join(parts)
+    with stage("history_write"):
+        history_store.append(session_id, user_input, response_text)
+    socket_stats["messages"] += 1
+    return await _send(websocket, {"id": message_id, "event": "done", "answer": response_text})
+
+@app.websocket("/ws")
+async def chat_socket(websocket: WebSocket, session_id: Optional[str] = session_id_query(None)):
+    """
+    One conversation per connection, answered like /query/ and /upload/ without a new HTTP
+    request per message. Text frames are JSON:
+
+        {"type": "query", "text": "...", "id": 1}
+        {"type": "file", "name": "report.pdf", "size": 1234, "query": "...", "id": 2}
+
+    and a "file" message is followed by one binary frame holding the file. Answers stream back
+    as {"id", "event": "chunk", "text"} frames and end with a "done" frame carrying the full
+    answer, or an "error" frame. The session's turns stay in memory (written to MySQL in the
+    background) and are cleared when the socket closes. Without a session_id the connection
+    gets a session of its own, so it never shares (or clears) the default session.
+
+    CORSMiddleware does not apply to WebSockets, so the browser's Origin is checked against
+    the same allowlist here; clients that send no Origin (not a browser) are let in.
+    """
+    origin = websocket.headers.get("origin")
+    if origin is not None and origin not in origins:
+        socket_stats["rejected_origins"] += 1
+        await websocket.close(code=1008)
+        return
+    session_id = session_id or uuid.uuid4().hex
+    await websocket.accept()
+    socket_stats["open"] += 1
+    socket_stats["connections"] += 1
+    pending_file = None
+    try:
+        while True:
+            try:
+                frame = await asyncio.wait_for(websocket.receive(), WS_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                await websocket.close(code=1000, reason="idle")
+                break
+            if frame["type"] == "websocket.disconnect":
+                break
+
+            if frame.get("bytes") is not None:
+                # File content for the preceding "file" message
+                header, pending_file = pending_file, None
+                if header is None:
+                    ok = await _send(websocket, {"event": "error", "detail": "Send a file message before the file"})
+                elif len(frame["bytes"]) > MAX_UPLOAD_BYTES:
+                    ok = await _send(websocket, {"id": header["id"], "event": "error", "detail": TOO_LARGE_MESSAGE})
+                else:
+                    ok = await socket_file(websocket, session_id, header, frame["bytes"])
+                if not ok:
+                    break
+                continue
+
+            try:
+                message = json.loads(frame.get("text") or "")
+                kind = message.get("type")
+            except (ValueError, AttributeError):
+                message, kind = {}, None
+            message_id = message.get("id")
+
+            if kind == "query" and str(message.get("text") or "").strip():
+                user_input = str(message["text"]).strip()
+                ok = await socket_query(websocket, session_id, message_id, user_input)
+            elif kind == "file" and message.get("name"):
+                if isinstance(message.get("size"), int) and message["size"] > MAX_UPLOAD_BYTES:
+                    ok = await _send(websocket, {"id": message_id, "event": "error", "detail": TOO_LARGE_MESSAGE})
+                else:
+                    pending_file = {"id": message_id, "name": str(message["name"]),
+                                    "query": str(message.get("query") or "").strip()}
+                    continue
+            else:
+                ok = await _send(websocket, {"id": message_id, "event": "error",
+                                             "detail": 'Expected a "query" message with text or a "file" message with a name'})
+            if not ok:
+                break
+    finally:
+        socket_stats["open"] -= 1
+        try:
+            if session_id != DEFAULT_SESSION:
+                await run_in_threadpool(history_store.clear, session_id)
+        except Exception as e:
+            logger.error(f"Error clearing chat history for closed WebSocket: {e}")
+
+async def socket_query(websocket, session_id, message_id, user_input):
+    """A text question over the socket, routed like /query/"""
+    async def respond():
+        response = local_answer(user_input)
+        if response is not None:
+            return response
+        previous_chats = await recent_chats(session_id)
+        response = cached_answer(user_input, previous_chats)
+        if response is None:
+            response = await single_flight.run(
+                flight_key("query", user_input, previous_chats),
+                lambda: llm_lane.run(handle_medical_question, user_input, previous_chats, stream=True)
+            )
+        return response
+
+    return await socket_turn(websocket, session_id, message_id, user_input, respond, llm_lane)
+
+async def socket_file(websocket, session_id, header, contents):
+    """A file (and optional question) over the socket, routed like /upload/"""
+    mime_type = sniff_mime_type(io.BytesIO(contents)) or "application/octet-stream"
+    UPLOAD_TYPES.inc(mime_type=mime_type)
+    digest = hashlib.sha256(contents).hexdigest()
+    filename, query_text = header["name"], header["query"]
+    logger.info(f"Processing WebSocket file: {filename} ({mime_type}, {len(contents)} bytes), Query: {'Yes' if query_text else 'No'}")
+
+    async def respond():
+        previous_chats = await recent_chats(session_id)
+        return await single_flight.run(
+            flight_key("upload", query_text, previous_chats, digest),
+            lambda: upload_lane.run(
+                handle_file_upload, contents, filename, query_text, previous_chats,
+                stream=True, mime_type=mime_type, digest=digest
+            )
+        )
+
+    user_input = f"[FILE: {filename}]" + (f" {query_text}" if query_text else "")
+    return await socket_turn(websocket, session_id, header["id"], user_input, respond, upload_lane)
+
+# navigator.sendBeacon always sends POST, so accept both methods
+@app.api_route("/clear-history/", methods=["GET", "POST"])
+async def clear_chat_history(session_id: str = session_id_query()):
+    """Clear a session's chat history (called when frontend closes or refreshes)"""
+    try:
+        await run_in_threadpool(history_store.clear, session_id)
         return {"message": "Chat history cleared successfully", "status": "success"}
     except Exception as e:
         logger.error(f"Error clearing chat history: {e}")
         raise HTTPException(status_code=500, detail="Error clearing chat history")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Stage latency histograms, routing counters and component stats in Prometheus format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "message": "API is running normally"}
+    return {
+        "status": "healthy",
+        "message": "API is running normally",
+        "llm_lane": llm_lane.stats(),
+        "upload_lane": upload_lane.stats(),
+        "llm": llm_client.stats(),
+        "response_cache": response_cache.stats(),
+        "history": history_store.stats(),
+        "retention": retention_job.stats(),
+        "context": context_builder.stats(),
+        "knowledge_base": knowledge_base.stats(),
+        "single_flight": single_flight.stats(),
+        "document_cache": document_cache.stats(),
+        "images": image_stats(),
+        "websocket": dict(socket_stats)
+    }
 
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+
+    parser = argparse.ArgumentParser(description="Run the Nidhaan Healthcare API")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 0)),
+                        help="worker processes for production; without it a single auto-reloading dev server runs")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--skip-migrate", action="store_true",
+                        help="skip the schema check when `python database.py` already ran for this deployment")
+    args = parser.parse_args()
+
+    if not args.skip_migrate:
+        # Once, in this parent process, before any worker starts
+        db_manager.migrate()
+        db_manager.close_connection()
+
+    if args.workers > 1:
+        # Workers share one socket, so a session's requests can reach any of them:
+        # history must not be served from process memory
+        os.environ["HISTORY_SHARED"] = "1"
+    if args.workers:
+        uvicorn.run("vector:app", host=args.host, port=args.port, workers=args.workers, log_level="info")
+    else:
+        uvicorn.run("vector:app", host=args.host, port=args.port, reload=True, log_level="info")